@@ -0,0 +1,110 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QTimer, QSize, Qt
+from PyQt5.QtGui import QImageReader, QMovie, QPixmap
+
+from memory import LOW_MEMORY
+
+# Single decode thread: GIF decoding never runs on the GUI thread and two
+# rotations can't decode at the same time
+decodeExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gif-decode")
+
+DEFAULT_FRAME_CACHE_MB = int(os.getenv("GIF_FRAME_CACHE_MB", 16 if LOW_MEMORY else 48))
+
+
+def decodeFrames(localPath: str, displaySize: QSize, maxCacheBytes: int):
+    # Runs in the decode thread. Frames are decoded straight at display size
+    # (QImage is safe off the GUI thread, QPixmap is not). Returns the
+    # (frames, scaledSize) pair, frames is None when they don't fit the cache.
+    reader = QImageReader(localPath)
+    scaledSize = reader.size().scaled(displaySize, Qt.KeepAspectRatio)
+    if scaledSize.isValid() and not scaledSize.isEmpty():
+        reader.setScaledSize(scaledSize)
+
+    frames = []
+    totalBytes = 0
+    while reader.canRead():
+        image = reader.read()
+        if image.isNull():
+            break
+        totalBytes += image.sizeInBytes()
+        if totalBytes > maxCacheBytes:
+            return None, scaledSize
+        frames.append((image, max(reader.nextImageDelay(), 20)))
+    return frames, scaledSize
+
+
+class AnimatedImage:
+    # Animated image (GIF) renderer for the player's image label. Frames are
+    # decoded off the GUI thread into a capped cache; animations too large for
+    # the cache are streamed by a scaled QMovie instead. release() drops all
+    # decoded frames when the ad rotates out.
+
+    def __init__(self, label, maxCacheBytes: int = DEFAULT_FRAME_CACHE_MB * 1024 * 1024):
+        self.label = label
+        self.maxCacheBytes = maxCacheBytes
+        self.frames = []
+        self.frameIndex = 0
+        self.movie = None
+        # Bumped on every play/release so a late decode for an ad that was
+        # already rotated out is discarded
+        self.generation = 0
+
+        self.frameTimer = QTimer()
+        self.frameTimer.setSingleShot(True)
+        self.frameTimer.timeout.connect(self.showNextFrame)
+
+    async def play(self, localPath: str):
+        self.release()
+        generation = self.generation
+
+        loop = asyncio.get_running_loop()
+        frames, scaledSize = await loop.run_in_executor(
+            decodeExecutor, decodeFrames, localPath, self.label.size(), self.maxCacheBytes)
+        if generation != self.generation:
+            return
+
+        if frames:
+            print(f"GIF decoded: {len(frames)} frames at {scaledSize.width()}x{scaledSize.height()}")
+            self.frames = frames
+            self.frameIndex = 0
+            self.showNextFrame()
+            return
+
+        # Too large to keep decoded: let QMovie decode one frame at a time
+        movie = QMovie(localPath)
+        if not movie.isValid():
+            self.label.setText("Invalid GIF")
+            print("Invalid GIF data")
+            return
+        print("GIF exceeds frame cache, streaming with QMovie")
+        movie.setCacheMode(QMovie.CacheNone)
+        movie.setScaledSize(scaledSize)
+        self.movie = movie
+        self.label.setMovie(movie)
+        movie.start()
+
+    def showNextFrame(self):
+        if not self.frames:
+            return
+        image, delay = self.frames[self.frameIndex]
+        self.label.setPixmap(QPixmap.fromImage(image))
+        self.frameIndex = (self.frameIndex + 1) % len(self.frames)
+        if len(self.frames) > 1:
+            self.frameTimer.start(delay)
+
+    def release(self):
+        self.generation += 1
+        self.frameTimer.stop()
+        if self.isActive():
+            self.label.clear()
+        self.frames = []
+        if self.movie is not None:
+            self.movie.stop()
+            self.movie.deleteLater()
+            self.movie = None
+
+    def isActive(self):
+        return bool(self.frames) or self.movie is not None
@@ -0,0 +1,35 @@
+import time
+from collections import deque
+
+
+def wallClockMs() -> float:
+    return time.time() * 1000
+
+
+class ClockSync:
+    # NTP-style estimate of the server clock from WebSocket heartbeats.
+    # Each heartbeat carries t0 (client send); the ack carries t1/t2 (server
+    # receive/send) and t3 is taken on arrival. The sample with the lowest
+    # round trip in a sliding window is trusted most, since it saw the least
+    # queuing; the window keeps the estimate tracking local clock drift.
+
+    def __init__(self, windowSize: int = 8):
+        self.samples = deque(maxlen=windowSize)  # (rttMs, offsetMs)
+        self.offsetMs = 0.0
+        self.rttMs = None
+
+    def addSample(self, t0: float, t1: float, t2: float, t3: float):
+        rtt = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        if rtt < 0:
+            # Local clock stepped mid-exchange
+            return
+        self.samples.append((rtt, offset))
+        self.rttMs, self.offsetMs = min(self.samples)
+
+    def isSynced(self) -> bool:
+        return bool(self.samples)
+
+    def now(self) -> float:
+        # Current server time in epoch milliseconds
+        return wallClockMs() + self.offsetMs
@@ -0,0 +1,405 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import aiohttp
+
+import utils
+from clocksync import ClockSync, wallClockMs
+from downloads import DownloadScheduler, playlistDueTimes
+from memory import MEMORY_SAMPLE_INTERVAL, MemoryTracker
+from playlog import PlayLog
+
+HEARTBEAT_INTERVAL = 5
+# Slots are looked up this far ahead so a timer firing a little early still
+# lands in the next slot instead of replaying the current one
+SLOT_GUARD_MS = 5
+# Prefetched media stays cached this long past its schedule's start, until
+# the schedule shows up in the playlist
+PREFETCH_KEEP_MS = 3600 * 1000
+# How soon the rotation looks again when no ad of the playlist is cached yet
+MEDIA_WAIT_MS = 1000
+
+
+class PlayerCore:
+    # Scheduling, caching and sync logic of a billboard, free of Qt and VLC.
+    # BillboardPlayer renders on screen; simulator.VirtualBillboard runs the
+    # same logic headless. Subclasses implement showStatus() and isShowingAd().
+
+    # Check downloads against the ad's size_bytes/sha256 when known
+    verifyDownloads = True
+
+    def __init__(self, apiBase: str, wsBase: str, clientId: str, cacheDir: Path,
+                 playLogPath: Path, syncPlayback: bool = True, billboardId: int = None, **kwargs):
+        super().__init__(**kwargs)
+        self.apiBase = apiBase
+        self.clientId = clientId
+        self.wsUrl = f"{wsBase}/ws/client?client_id={clientId}"
+        if billboardId is not None:
+            # Only receive prefetch hints for this billboard's schedules
+            self.wsUrl += f"&billboard_id={billboardId}"
+
+        # Setup local cache directory
+        self.cacheDir = Path(cacheDir)
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        print(f"Media cache directory: {self.cacheDir.absolute()}")
+
+        self.schedules = []
+        self.currentIndex = 0
+        # Set while no ad of the playlist has its media cached
+        self.waitingForMedia = False
+
+        # Cache management
+        self.cachedMedia = {}  # URL -> local_path mapping
+        # URL -> ad metadata (file_type, size_bytes, sha256, ...) from the
+        # schedules and prefetch hints, used to name and verify downloads
+        self.mediaInfo = {}
+        # Orders downloads by when the playlist needs them, under a bandwidth cap
+        self.downloads = DownloadScheduler(self)
+        # URL -> start (server epoch ms) of hinted schedules not yet playing
+        self.prefetchDue = {}
+        self.memory = MemoryTracker()
+
+        # Shared HTTP session, created on first use inside the event loop
+        self.session = None
+        # Open WebSocket while listenWs is connected
+        self.ws = None
+        # Schedule refresh in progress, and whether another was requested meanwhile
+        self.refreshTask = None
+        self.refreshAgain = False
+
+        # Proof of play
+        self.playLog = PlayLog(playLogPath, apiBase, clientId)
+
+        # Server timebase; with syncPlayback the rotation follows epoch
+        # aligned slots so screens with the same playlist switch together
+        self.clock = ClockSync()
+        self.syncPlayback = syncPlayback
+
+    # -------- Hooks --------
+    def showStatus(self, text: str):
+        print(text)
+
+    def isShowingAd(self) -> bool:
+        return False
+
+    def mediaReady(self, url: str):
+        # Called when the media for `url` has been downloaded and verified
+        pass
+
+    def mediaSourceUrl(self, url: str) -> str:
+        # Where the media for `url` is actually downloaded from
+        return url
+
+    def getSession(self) -> aiohttp.ClientSession:
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    # -------- Rotation --------
+    def localMediaFor(self, schedule: dict):
+        mediaUrl = schedule.get("ad", {}).get("file_path", "")
+        localPath = utils.getLocalMediaPath(self, mediaUrl)
+        if not localPath or not os.path.exists(localPath):
+            return None
+        return localPath
+
+    def readySchedules(self) -> list:
+        # [(index, schedule, localPath)] of the ads whose media is cached;
+        # the others stay in the playlist and join once their download lands
+        ready = []
+        for index, schedule in enumerate(self.schedules):
+            localPath = self.localMediaFor(schedule)
+            if localPath is not None:
+                ready.append((index, schedule, localPath))
+        return ready
+
+    def nextSchedule(self):
+        # Returns (schedule, localPath, msUntilNextSwitch) for the ad to show
+        # now, skipping ads whose media isn't cached. When none is, schedule
+        # and localPath are None and the caller looks again after the delay
+        if not self.schedules or self.currentIndex >= len(self.schedules):
+            return None
+
+        ready = self.readySchedules()
+        self.waitingForMedia = not ready
+        if not ready:
+            return None, None, MEDIA_WAIT_MS
+
+        if self.syncPlayback and self.clock.isSynced():
+            slot = self.currentSlot(ready)
+            if slot is not None:
+                return slot
+
+        # First ready ad from the current position, wrapping around
+        index, schedule, localPath = next(
+            (item for item in ready if item[0] >= self.currentIndex), ready[0])
+        duration = utils.formatDuration(schedule.get("duration", "PT10S"))
+
+        # Move to next schedule
+        self.currentIndex = (index + 1) % len(self.schedules)
+        return schedule, localPath, duration
+
+    def currentSlot(self, ready: list):
+        # The ready ads repeat back to back from the Unix epoch on the server
+        # clock, so the slot for "now" is absolute: every transition is
+        # computed from the timebase and timer error never accumulates.
+        # Screens caching the same files therefore still switch together
+        durations = [utils.formatDuration(schedule.get("duration", "PT10S")) for _, schedule, _ in ready]
+        cycle = sum(durations)
+        if cycle <= 0:
+            return None
+        position = (self.clock.now() + SLOT_GUARD_MS) % cycle
+
+        for (index, schedule, localPath), duration in zip(ready, durations):
+            if position < duration:
+                break
+            position -= duration
+
+        self.currentIndex = (index + 1) % len(self.schedules)
+        return schedule, localPath, int(duration - position) + SLOT_GUARD_MS
+
+    # -------- Sync --------
+    async def loadSchedules(self) -> bool:
+        # Initial fetch and cache; True when there is something to play
+        rawSchedules = await utils.fetchSchedules(self)
+        if not rawSchedules:
+            self.showStatus("No schedules available")
+            return False
+
+        # Filter active schedules
+        self.schedules = utils.formatSchedules(rawSchedules)
+        if not self.schedules:
+            self.showStatus("No active schedules found")
+            return False
+
+        # Start caching; playback begins with the first file that lands
+        print("Caching media files...")
+        self.rememberMedia(self.schedules)
+        if not await utils.cacheAllMedia(self, schedules=self.schedules, startIndex=self.currentIndex):
+            self.showStatus("Failed to cache media files")
+            return False
+        return True
+
+    async def applySchedules(self, newSchedules: list):
+        if newSchedules == self.schedules:
+            return
+        print("Schedules changed, updating cache...")
+        self.rememberMedia(newSchedules)
+
+        # Queue the new media. The playlist is swapped as soon as one of its
+        # ads can play, the rest join the rotation as their files land
+        startIndex = self.currentIndex if self.currentIndex < len(newSchedules) else 0
+        success = await utils.cacheAllMedia(self, schedules=newSchedules, startIndex=startIndex)
+
+        if success:
+            oldCount = len(self.schedules)
+            self.schedules = newSchedules
+
+            # Reset index if needed
+            if self.currentIndex >= len(self.schedules):
+                self.currentIndex = 0
+
+            print(
+                f"Schedules updated: {oldCount} -> {len(self.schedules)}")
+
+            self.pruneCachedMedia()
+            # Drop files no longer referenced, off the GUI thread; downloads
+            # still queued or preempted keep their partial files
+            keepFiles = set(self.cachedMedia.values()) | await self.downloads.pendingFiles()
+            await utils.runIo(utils.cleanupOldCache, self, keepFiles)
+
+    def rememberMedia(self, schedules: list):
+        for schedule in schedules:
+            ad = schedule.get("ad") or {}
+            if ad.get("file_path"):
+                self.mediaInfo[ad["file_path"]] = dict(ad)
+
+    def pruneCachedMedia(self):
+        # Forget media neither the playlist nor a pending prefetch needs, so
+        # cachedMedia and the files on disk stay bounded over long uptimes
+        now = self.clock.now()
+        self.prefetchDue = {
+            url: startMs for url, startMs in self.prefetchDue.items()
+            if startMs + PREFETCH_KEEP_MS > now
+        }
+        needed = {s.get("ad", {}).get("file_path") for s in self.schedules}
+        needed.update(self.prefetchDue)
+        for url in list(self.cachedMedia):
+            if url not in needed:
+                del self.cachedMedia[url]
+        for url in list(self.mediaInfo):
+            if url not in needed:
+                del self.mediaInfo[url]
+
+    async def refreshSchedules(self):
+        rawSchedules = await utils.fetchSchedules(self)
+        await self.applySchedules(utils.formatSchedules(rawSchedules))
+
+    def requestRefresh(self):
+        # One refresh runs at a time; requests arriving meanwhile collapse
+        # into a single extra pass, so bursts never queue full re-caches
+        if self.refreshTask is not None and not self.refreshTask.done():
+            self.refreshAgain = True
+            return
+        self.refreshTask = asyncio.create_task(self.refreshLoop())
+
+    async def refreshLoop(self):
+        while True:
+            self.refreshAgain = False
+            try:
+                await self.refreshSchedules()
+            except Exception as e:
+                print(f"Schedule refresh failed: {e}")
+            if not self.refreshAgain:
+                break
+
+    async def handleMessage(self, message):
+        if isinstance(message, list):
+            # Full schedule list pushed by the server
+            await self.applySchedules(utils.formatSchedules(message))
+            return
+
+        messageType = message.get("type")
+        if messageType == "heartbeat_ack":
+            if message.get("t0") is not None:
+                self.clock.addSample(message["t0"], message["t1"], message["t2"], wallClockMs())
+
+        elif messageType == "cache_command":
+            # Downloads may take a while, keep reading the socket meanwhile
+            asyncio.create_task(self.runCacheCommand(message))
+
+        elif messageType == "prefetch":
+            self.prefetchAssets(message.get("assets", []))
+
+        elif messageType in ("schedules_changed", "new_schedule_created"):
+            print(f"Schedule change received via WebSocket ({message.get('count', 1)} changes)")
+            # The notification only carries schedule ids, refetch the
+            # listing to get the joined ad/billboard data
+            self.requestRefresh()
+
+    def prefetchAssets(self, assets: list):
+        # Stage media of schedules that haven't started yet. Due at their
+        # start time, they queue behind everything the current playlist needs
+        for asset in assets:
+            try:
+                startTime = datetime.fromisoformat(asset["start_time"]).replace(tzinfo=timezone.utc)
+            except (KeyError, ValueError):
+                continue
+            startMs = startTime.timestamp() * 1000
+            self.mediaInfo.setdefault(asset["url"], {
+                "file_path": asset["url"],
+                "file_type": asset.get("file_type"),
+                "size_bytes": asset.get("size_bytes"),
+                "sha256": asset.get("sha256"),
+            })
+            self.prefetchDue[asset["url"]] = max(startMs, self.prefetchDue.get(asset["url"], 0))
+            self.downloads.fetch(asset["url"], max(0, startMs - self.clock.now()))
+        print(f"Prefetch hints received for {len(assets)} assets")
+
+    async def runCacheCommand(self, command: dict):
+        # Execute a remote purge/invalidate/prefetch and acknowledge it with
+        # the bytes freed
+        action = command.get("action")
+        urls = command.get("urls") or []
+        ack = {"command_id": command.get("command_id"), "status": "ok", "freed_bytes": 0, "files": 0}
+        print(f"Cache command: {action} ({len(urls) or 'all'} urls)")
+        try:
+            if action == "purge" and not urls:
+                # Everything the playlist and pending prefetches don't need
+                self.pruneCachedMedia()
+                keepFiles = set(self.cachedMedia.values()) | await self.downloads.pendingFiles()
+                ack["freed_bytes"], ack["files"] = await utils.runIo(utils.cleanupOldCache, self, keepFiles)
+
+            elif action in ("purge", "invalidate"):
+                paths = []
+                for url in urls:
+                    self.cachedMedia.pop(url, None)
+                    cachePath = self.cacheDir / await utils.runIo(utils.cacheFilenameFor, self, url)
+                    paths += [cachePath, utils.MediaFileWriter(cachePath).partPath]
+                ack["freed_bytes"], ack["files"] = await utils.runIo(utils.removeCacheFiles, paths)
+
+                # Purged media the playlist still shows is fetched again when
+                # it is due; invalidated media is always refetched
+                dueTimes = playlistDueTimes(self.schedules, self.currentIndex)
+                for url in urls:
+                    if url in dueTimes:
+                        self.downloads.fetch(url, dueTimes[url])
+                    elif action == "invalidate":
+                        self.downloads.fetch(url, max(0, self.prefetchDue.get(url, 0) - self.clock.now()))
+
+            elif action == "prefetch":
+                futures = [self.downloads.fetch(url, 0) for url in urls]
+                # Answer before the server stops waiting
+                done, notDone = await asyncio.wait(futures, timeout=command.get("timeout", 10) * 0.8)
+                ack["files"] = sum(1 for future in done if not future.cancelled() and future.result())
+                if notDone:
+                    ack["status"] = "queued"
+                elif ack["files"] < len(urls):
+                    ack["status"] = "failed"
+                    ack["detail"] = f"{len(urls) - ack['files']} downloads failed"
+
+            else:
+                ack["status"] = "unsupported"
+                ack["detail"] = f"unknown action {action}"
+
+        except Exception as e:
+            print(f"Cache command failed: {e}")
+            ack["status"] = "error"
+            ack["detail"] = str(e)
+
+        await self.sendWs("cache_ack", ack)
+
+    async def listenWs(self):
+        # Listen for WebSocket updates and refresh cache
+        try:
+            # compress=15 offers permessage-deflate to the server
+            async with self.getSession().ws_connect(self.wsUrl, protocols=utils.wsProtocols(), compress=15) as ws:
+                self.ws = ws
+                heartbeatTask = asyncio.create_task(self.heartbeatLoop())
+                try:
+                    async for msg in ws:
+                        if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                            await self.handleMessage(utils.decodeWsMessage(msg))
+                finally:
+                    heartbeatTask.cancel()
+
+        except Exception as e:
+            print(f"WebSocket error: {e}")
+        finally:
+            self.ws = None
+
+    async def sendWs(self, event: str, data: dict = None):
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.send_json({"event": event, "data": data})
+
+    async def heartbeatLoop(self):
+        # Keeps the connection alive and feeds the clock offset estimate
+        while True:
+            await self.sendWs("heartbeat", {"t0": wallClockMs()})
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def memoryLoop(self):
+        # RSS log, so slow leaks show up long before the OOM killer does
+        while True:
+            self.memory.sample()
+            print(f"Memory: {self.memory.summary()}, {len(self.cachedMedia)} cached media, "
+                  f"{len(self.playLog.events)} pending play events")
+            await asyncio.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    async def stopBackground(self):
+        # Download workers and a schedule refresh in progress; the HTTP
+        # session stays open, it may be shared
+        if self.refreshTask is not None:
+            self.refreshTask.cancel()
+            await asyncio.gather(self.refreshTask, return_exceptions=True)
+            self.refreshTask = None
+        await self.downloads.stop()
+
+    async def shutdown(self):
+        await self.stopBackground()
+        self.playLog.close()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
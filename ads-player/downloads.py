@@ -0,0 +1,242 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+
+import utils
+
+# 0 disables the cap
+DOWNLOAD_RATE_LIMIT_KBPS = float(os.getenv("DOWNLOAD_RATE_LIMIT_KBPS", 0))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 1))
+# Local time windows in which only urgent downloads run, e.g. "08:00-20:00"
+# or "22:00-06:00,12:00-13:00"
+QUIET_HOURS = os.getenv("QUIET_HOURS", "")
+# Media needed sooner than this is urgent and ignores quiet hours
+DOWNLOAD_URGENT_SECONDS = float(os.getenv("DOWNLOAD_URGENT_SECONDS", 300))
+# A running transfer only yields to one needed at least this much sooner,
+# so two jobs with close deadlines don't keep preempting each other
+PREEMPT_MARGIN_MS = 5000
+IDLE_RECHECK_SECONDS = 30
+
+
+def parseQuietHours(spec: str):
+    # "HH:MM-HH:MM,..." -> [(startMinute, endMinute)], windows may wrap midnight
+    windows = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = part.split("-")
+            startHour, startMinute = map(int, start.split(":"))
+            endHour, endMinute = map(int, end.split(":"))
+            windows.append((startHour * 60 + startMinute, endHour * 60 + endMinute))
+        except ValueError:
+            print(f"Ignoring invalid quiet hours window: {part}")
+    return windows
+
+
+def inQuietHours(windows, now: datetime = None) -> bool:
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        if start <= end:
+            if start <= minute < end:
+                return True
+        elif minute >= start or minute < end:
+            return True
+    return False
+
+
+def playlistDueTimes(schedules: list, startIndex: int = 0) -> dict:
+    # URL -> milliseconds until it first plays, walking the rotation from
+    # startIndex the way nextSchedule() will
+    dueTimes = {}
+    if not schedules:
+        return dueTimes
+    elapsed = 0
+    for offset in range(len(schedules)):
+        schedule = schedules[(startIndex + offset) % len(schedules)]
+        url = schedule.get("ad", {}).get("file_path")
+        if url and url not in dueTimes:
+            dueTimes[url] = elapsed
+        elapsed += utils.formatDuration(schedule.get("duration", "PT10S"))
+    return dueTimes
+
+
+class RateLimiter:
+    # Token bucket shared by every transfer, with one second worth of burst
+    def __init__(self, bytesPerSecond: float):
+        self.rate = bytesPerSecond
+        self.tokens = bytesPerSecond
+        self.updatedAt = time.monotonic()
+
+    async def acquire(self, size: int):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+        self.tokens -= size
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class DownloadJob:
+    def __init__(self, url: str, deadline: float, future):
+        self.url = url
+        self.deadline = deadline  # monotonic ms by which the media is needed
+        self.future = future
+        self.cacheFilename = None
+        # Task looking for a complete copy already on disk
+        self.resolving = None
+
+
+class DownloadScheduler:
+    # Downloads media in order of when the playlist needs it. fetch() queues
+    # a URL with its due time and returns a future for the local path; the
+    # most urgent job runs first and a running transfer is preempted (its
+    # .part file kept for a Range resume) when something more urgent arrives
+    # or quiet hours begin. All transfers share one bandwidth cap.
+
+    def __init__(self, playerInstance, rateLimitKbps: float = DOWNLOAD_RATE_LIMIT_KBPS,
+                 concurrency: int = DOWNLOAD_CONCURRENCY, quietHours: str = QUIET_HOURS):
+        self.player = playerInstance
+        self.rateLimiter = RateLimiter(rateLimitKbps * 1024) if rateLimitKbps > 0 else None
+        self.concurrency = max(1, concurrency)
+        self.quietWindows = parseQuietHours(quietHours)
+        self.queued = {}   # url -> DownloadJob waiting to run
+        self.running = {}  # url -> DownloadJob being transferred
+        self.wakeup = asyncio.Event()
+        self.workers = []
+
+    def nowMs(self) -> float:
+        return time.monotonic() * 1000
+
+    def fetch(self, url: str, dueInMs: float = 0):
+        # Queue `url` (or move it up) and return the future of its local path
+        deadline = self.nowMs() + dueInMs
+        job = self.running.get(url) or self.queued.get(url)
+        if job is not None:
+            job.deadline = min(job.deadline, deadline)
+        else:
+            job = DownloadJob(url, deadline, asyncio.get_running_loop().create_future())
+            self.queued[url] = job
+            job.resolving = asyncio.create_task(self.resolveCached(job))
+        self.startWorkers()
+        self.wakeup.set()
+        return job.future
+
+    def fetchPlaylist(self, schedules: list, startIndex: int = 0) -> dict:
+        # Queue every file of a playlist by when it first plays; {url: future}
+        return {
+            url: self.fetch(url, dueInMs)
+            for url, dueInMs in playlistDueTimes(schedules, startIndex).items()
+        }
+
+    async def resolveCached(self, job: DownloadJob):
+        # Media already complete on disk (e.g. after a restart) resolves right
+        # away, without waiting for its turn or for quiet hours to end
+        try:
+            job.cacheFilename = await utils.runIo(utils.cacheFilenameFor, self.player, job.url)
+            localPath = await utils.runIo(utils.findCachedMedia, self.player, job.url, job.cacheFilename)
+        except Exception as e:
+            print(f"Cache lookup for {job.url} failed: {e}")
+            return
+        if localPath is None or self.queued.get(job.url) is not job:
+            # Not on disk, or a worker already took it (and will find the file)
+            return
+        del self.queued[job.url]
+        print(f"Using cached file: {job.cacheFilename}")
+        self.player.cachedMedia[job.url] = localPath
+        self.player.mediaReady(job.url)
+        if not job.future.done():
+            job.future.set_result(localPath)
+
+    async def pendingFiles(self) -> set:
+        # Cache paths of unfinished jobs, kept by cleanupOldCache. Waits for
+        # the cache lookups so every queued job's file name is known
+        lookups = [job.resolving for job in list(self.queued.values()) if job.resolving is not None]
+        if lookups:
+            await asyncio.gather(*lookups, return_exceptions=True)
+        files = set()
+        for job in list(self.queued.values()) + list(self.running.values()):
+            if job.cacheFilename:
+                cachePath = self.player.cacheDir / job.cacheFilename
+                files.add(str(cachePath))
+                files.add(str(utils.MediaFileWriter(cachePath).partPath))
+        return files
+
+    def isUrgent(self, job: DownloadJob) -> bool:
+        return job.deadline - self.nowMs() <= DOWNLOAD_URGENT_SECONDS * 1000
+
+    def isEligible(self, job: DownloadJob) -> bool:
+        return self.isUrgent(job) or not inQuietHours(self.quietWindows)
+
+    def nextJob(self):
+        eligible = [job for job in self.queued.values() if self.isEligible(job)]
+        if not eligible:
+            return None
+        return min(eligible, key=lambda job: job.deadline)
+
+    def shouldYield(self, job: DownloadJob) -> bool:
+        # Polled by downloadMedia between chunks
+        if not self.isEligible(job):
+            return True
+        nextJob = self.nextJob()
+        return nextJob is not None and nextJob.deadline < job.deadline - PREEMPT_MARGIN_MS
+
+    def startWorkers(self):
+        if self.workers:
+            return
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+
+    async def worker(self):
+        while True:
+            job = self.nextJob()
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    # Time out to notice quiet hours ending or jobs turning urgent
+                    await asyncio.wait_for(self.wakeup.wait(), IDLE_RECHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            del self.queued[job.url]
+            self.running[job.url] = job
+            try:
+                job.cacheFilename = await utils.runIo(utils.cacheFilenameFor, self.player, job.url)
+                localPath = await utils.downloadMedia(
+                    self.player,
+                    job.url,
+                    lambda p, f: utils.updateDownloadProgress(self.player, p, f),
+                    rateLimiter=self.rateLimiter,
+                    shouldYield=lambda: self.shouldYield(job),
+                )
+            except utils.DownloadPreempted:
+                # Back in the queue, the next run resumes from the .part file
+                self.queued[job.url] = job
+                continue
+            except Exception as e:
+                print(f"Error downloading {job.url}: {e}")
+                localPath = None
+            finally:
+                self.running.pop(job.url, None)
+
+            if localPath:
+                self.player.cachedMedia[job.url] = localPath
+                self.player.mediaReady(job.url)
+            if not job.future.done():
+                job.future.set_result(localPath)
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        for job in list(self.queued.values()) + list(self.running.values()):
+            if job.resolving is not None:
+                job.resolving.cancel()
+            if not job.future.done():
+                job.future.cancel()
+        self.queued.clear()
+        self.running.clear()
@@ -0,0 +1,57 @@
+import ctypes
+import ctypes.util
+import os
+import resource
+import sys
+
+# Low-memory mode for 1 GB boards: smaller decode and media caches, shorter
+# VLC buffering, and glibc heap trimming after each RSS sample
+LOW_MEMORY = os.getenv("PLAYER_LOW_MEMORY", "0").lower() in ("1", "true", "yes")
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("MEMORY_SAMPLE_INTERVAL", 300))
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c")) if sys.platform.startswith("linux") else None
+except OSError:
+    libc = None
+
+
+def rssBytes() -> int:
+    # Current resident set size; falls back to the peak where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def trimHeap():
+    # Hand freed malloc arenas back to the OS (glibc only)
+    if libc is not None and hasattr(libc, "malloc_trim"):
+        libc.malloc_trim(0)
+
+
+class MemoryTracker:
+    # Periodic RSS samples with the peak and the growth since the first one
+    def __init__(self, lowMemory: bool = LOW_MEMORY):
+        self.lowMemory = lowMemory
+        self.baseline = None
+        self.peak = 0
+        self.last = 0
+
+    def sample(self) -> int:
+        if self.lowMemory:
+            trimHeap()
+        self.last = rssBytes()
+        self.peak = max(self.peak, self.last)
+        if self.baseline is None:
+            self.baseline = self.last
+        return self.last
+
+    def summary(self) -> str:
+        mb = 1024 * 1024
+        return (f"RSS {self.last / mb:.1f} MB (peak {self.peak / mb:.1f} MB, "
+                f"{(self.last - (self.baseline or self.last)) / mb:+.1f} MB since start)")
@@ -1,31 +1,40 @@
 import vlc
 import sys
-import json
 import asyncio
-import aiohttp
-import os
+from collections import OrderedDict
 from pathlib import Path
 from PyQt5.QtWidgets import QApplication, QLabel, QWidget, QVBoxLayout, QFrame, QStackedWidget
-from PyQt5.QtCore import QTimer, Qt, QSize
+from PyQt5.QtCore import QTimer, Qt, QSize, pyqtSignal
 from qasync import QEventLoop
-import utils
+import rendering
+from animatedimage import AnimatedImage
+from core import PlayerCore
 
 API_BASE = "http://127.0.0.1:8000"
-WS_URL = "ws://127.0.0.1:8000/ws/client?client_id=raspi-1"
+WS_BASE = "ws://127.0.0.1:8000"
+CLIENT_ID = "raspi-1"
+# Billboard this screen plays for; None receives prefetch hints for all of them
+BILLBOARD_ID = None
 
 
-class BillboardPlayer(QWidget):
+class BillboardPlayer(PlayerCore, QWidget):
+    # Emitted from VLC's event thread, handled on the GUI thread
+    videoEnded = pyqtSignal()
+
     def __init__(self):
-        super().__init__()
+        super().__init__(
+            apiBase=API_BASE,
+            wsBase=WS_BASE,
+            clientId=CLIENT_ID,
+            billboardId=BILLBOARD_ID,
+            cacheDir=Path("media_cache"),
+            # Proof of play, spooled next to the media cache
+            playLogPath=Path("playlog.jsonl"),
+        )
         self.setWindowTitle("Billboard Player")
         self.setGeometry(0, 0, 800, 600)
         self.setMinimumSize(QSize(400, 300))
 
-        # Setup local cache directory
-        self.cacheDir = Path("media_cache")
-        self.cacheDir.mkdir(exist_ok=True)
-        print(f"Media cache directory: {self.cacheDir.absolute()}")
-
         # Use QStackedWidget for smooth transitions
         self.layout = QVBoxLayout(self)
         self.stackedWidget = QStackedWidget(self)
@@ -37,9 +46,11 @@ class BillboardPlayer(QWidget):
         self.imageWidget.setStyleSheet(
             "background-color: black; color: white;")
 
+        # GIF renderer drawing into imageWidget
+        self.animatedImage = AnimatedImage(self.imageWidget)
+
         self.videoFrame = QFrame(self)
         self.videoFrame.setStyleSheet("background-color: black;")
-        self.onVideoEnd = utils.onVideoEnd
 
         # Add widgets to stack
         self.stackedWidget.addWidget(self.imageWidget)  # index 0
@@ -54,148 +65,116 @@ class BillboardPlayer(QWidget):
         ]
         self.vlcInstance = vlc.Instance(vlcArgs)
         self.vlcPlayer = self.vlcInstance.media_player_new()
+        # path -> vlc.Media, reused across starts and restarts
+        self.vlcMediaCache = OrderedDict()
 
-        # VLC event manager for handling video end
+        # VLC event manager for handling video end. The callback runs on a
+        # VLC thread and passes the event, so it only emits the signal
         self.vlcEvents = self.vlcPlayer.event_manager()
         self.vlcEvents.event_attach(
-            vlc.EventType.MediaPlayerEndReached, self.onVideoEnd)
+            vlc.EventType.MediaPlayerEndReached, lambda event: self.videoEnded.emit())
+        self.videoEnded.connect(lambda: rendering.onVideoEnd(self))
 
-        self.schedules = []
-        self.currentIndex = 0
         self.timer = QTimer()
+        # Slot boundaries are absolute, a coarse timer would add jitter
+        self.timer.setTimerType(Qt.PreciseTimer)
         self.timer.timeout.connect(self.playNext)
 
         # Video loop management
         self.videoloopTimer = QTimer()
-        self.videoloopTimer.timeout.connect(utils.restartVideo)
+        self.videoloopTimer.timeout.connect(lambda: rendering.restartVideo(self))
 
         self.currentMediaType = None
         self.isPlayingVideo = False
         self.currentVideoPath = None
 
-        # Cache management
-        self.cachedMedia = {}  # URL -> local_path mapping
+    def showStatus(self, text: str):
+        self.imageWidget.setText(text)
+
+    def isShowingAd(self) -> bool:
+        return self.timer.isActive()
+
+    def mediaReady(self, url: str):
+        # Don't leave the screen waiting for the retry timer
+        if self.waitingForMedia:
+            self.playNext()
 
     def playNext(self):
         # Play next media from local cache
-        if not self.schedules or self.currentIndex >= len(self.schedules):
+        nextItem = self.nextSchedule()
+        if nextItem is None:
+            self.playLog.finishPlay()
             self.imageWidget.setText("No active schedules")
             self.stackedWidget.setCurrentIndex(0)
             return
 
-        schedule = self.schedules[self.currentIndex]
+        schedule, localPath, duration = nextItem
+        if schedule is None:
+            # Nothing cached yet; mediaReady() resumes as soon as a file lands
+            self.playLog.finishPlay()
+            self.animatedImage.release()
+            rendering.stopVideo(self)
+            self.imageWidget.setText("Waiting for media...")
+            self.stackedWidget.setCurrentIndex(0)
+            self.timer.start(duration)
+            return
+
         adData = schedule.get("ad", {})
         mediaUrl = adData.get("file_path", "")
         mediaType = adData.get("file_type", "")
 
         print(f"Playing media: {mediaUrl} (type: {mediaType})")
 
-        # Get local path for media
-        localPath = utils.getLocalMediaPath(self, mediaUrl)
-
-        if not localPath or not os.path.exists(localPath):
-            print(f"Local media file not found: {localPath}")
-            self.imageWidget.setText("Media file not available")
+        self.playLog.startPlay(schedule)
+        # Route to appropriate player based on media type
+        # GIFs first, "image/gif" would also match the image branch
+        if mediaType.endswith("gif"):
+            rendering.gifSlider(self, localPath)
+        elif mediaType.startswith("image"):
+            rendering.imageSlider(self, localPath)
+        elif mediaType.startswith("video"):
+            rendering.videoplayer(self, localPath)
+        else:
+            print(f"Unknown media type: {mediaType}")
+            self.playLog.failPlay(f"unsupported media type: {mediaType}")
+            self.imageWidget.setText(f"Unsupported media: {mediaType}")
             self.stackedWidget.setCurrentIndex(0)
 
-        else:
-            # Route to appropriate player based on media type
-            if mediaType.startswith("image"):
-                utils.imageSlider(self, localPath)
-            elif mediaType.endswith("gif"):
-                utils.gifSlider(localPath)
-            elif mediaType.startswith("video"):
-                utils.videoplayer(self, localPath)
-            else:
-                print(f"Unknown media type: {mediaType}")
-                self.imageWidget.setText(f"Unsupported media: {mediaType}")
-                self.stackedWidget.setCurrentIndex(0)
-
-        # Set timer for duration
-        duration = utils.formatDuration(schedule.get("duration", "PT10S"))
+        # Set timer until the next switch (end of the slot when synchronized)
         print(f"Media will play for {duration/1000} seconds")
         self.timer.start(duration)
 
-        # Move to next schedule
-        self.currentIndex = (self.currentIndex + 1) % len(self.schedules)
-
     def stop(self):
         # Stop all playback
         self.timer.stop()
-        utils.stopVideo(self)
+        self.playLog.finishPlay()
+        self.animatedImage.release()
+        rendering.stopVideo(self)
         self.stackedWidget.setCurrentIndex(0)
 
-    async def listenWs(self):
-        # Listen for WebSocket updates and refresh cache
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.ws_connect(WS_URL) as ws:
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            newScheduleData = json.loads(msg.data)
-                            print("New schedule received via WebSocket")
-
-                            # Format new schedules
-                            newSchedules = utils.formatSchedules(
-                                newScheduleData)
-
-                            if newSchedules != self.schedules:
-                                print("Schedules changed, updating cache...")
-
-                                # Update cache with new media
-                                success = await utils.cacheAllMedia(self, schedules=newSchedules)
-
-                                if success:
-                                    oldCount = len(self.schedules)
-                                    self.schedules = newSchedules
-
-                                    # Reset index if needed
-                                    if self.currentIndex >= len(self.schedules):
-                                        self.currentIndex = 0
-
-                                    print(
-                                        f"Schedules updated: {oldCount} -> {len(self.schedules)}")
-
-        except Exception as e:
-            print(f"WebSocket error: {e}")
-
     async def run(self):
         # Initialize player with cached media
         print("Starting Billboard Player...")
 
-        # Fetch initial schedules
-        rawSchedules = await utils.fetchSchedules(self)
-        if not rawSchedules:
-            self.imageWidget.setText("No schedules available")
+        if not await self.loadSchedules():
             return
 
-        # Filter active schedules
-        self.schedules = utils.formatSchedules(rawSchedules)
-
-        if not self.schedules:
-            self.imageWidget.setText("No active schedules found")
-            return
-
-        # Cache all media files
-        print("Caching media files...")
-        cache_success = await utils.cacheAllMedia(self, schedules=self.schedules)
-
-        if cache_success:
-            print(
-                f"Starting playback with {len(self.schedules)} cached schedules")
-            self.playNext()
-        else:
-            self.imageWidget.setText("Failed to cache media files")
-            return
+        print(
+            f"Starting playback with {len(self.schedules)} cached schedules")
+        self.playNext()
 
-        # Start WebSocket listener
+        # Start WebSocket listener and proof-of-play uploads
         asyncio.create_task(self.listenWs())
+        asyncio.create_task(self.playLog.uploadLoop(self.getSession()))
+        asyncio.create_task(self.memoryLoop())
 
     def closeEvent(self, event):
         # Clean shutdown
         print("Shutting down player...")
         self.stop()
+        asyncio.ensure_future(self.shutdown())
         try:
+            rendering.releaseVlcMedia(self)
             self.vlcPlayer.release()
             self.vlcInstance.release()
         except:
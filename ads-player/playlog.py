@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import aiohttp
+
+import utils
+
+# Cap on events held while the server is unreachable; the oldest are dropped
+# beyond it rather than growing the player until it is OOM-killed
+MAX_PENDING_EVENTS = int(os.getenv("PLAYLOG_MAX_PENDING_EVENTS", 100000))
+
+class PlayLog:
+    # Proof-of-play buffer. Finished plays are appended to a local spool file
+    # so they survive restarts, and uploaded to the server in batches. Events
+    # are only dropped from the spool once the server acknowledged them.
+
+    def __init__(self, spoolPath: Path, apiBase: str, clientId: str,
+                 batchSize: int = 500, uploadInterval: float = 30,
+                 maxPending: int = MAX_PENDING_EVENTS):
+        self.spoolPath = Path(spoolPath)
+        self.apiBase = apiBase
+        self.clientId = clientId
+        self.batchSize = batchSize
+        self.uploadInterval = uploadInterval
+        self.maxPending = maxPending
+
+        self.events = self.loadSpool()  # event_id -> event, in play order
+        self.spool = open(self.spoolPath, "a", encoding="utf-8")
+        self.current = None
+        # Set while upload() rewrites the spool in ioExecutor
+        self.compacting = False
+        # Events acked during the current upload pass
+        self.acked = 0
+        print(f"Play log: {len(self.events)} pending events in {self.spoolPath}")
+
+    def loadSpool(self):
+        events = {}
+        if not self.spoolPath.exists():
+            return events
+        with open(self.spoolPath, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                    events[event["event_id"]] = event
+                except (ValueError, KeyError):
+                    # Torn last line after a power cut
+                    continue
+        return events
+
+    def startPlay(self, schedule: dict, error: str = None):
+        # Close the previous play and start timing the new one
+        self.finishPlay()
+        self.current = {
+            "event": {
+                "event_id": uuid.uuid4().hex,
+                "billboard_id": schedule.get("billboard_id"),
+                "ad_id": schedule.get("ad_id"),
+                "schedule_id": schedule.get("id"),
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "error": error,
+            },
+            "startedMonotonic": time.monotonic(),
+        }
+
+    def failPlay(self, error: str):
+        # Attach an error to the play in progress (e.g. VLC failed to start)
+        if self.current:
+            self.current["event"]["error"] = error
+
+    def finishPlay(self):
+        if not self.current:
+            return
+        event = self.current["event"]
+        event["duration_ms"] = int((time.monotonic() - self.current["startedMonotonic"]) * 1000)
+        self.current = None
+
+        self.events[event["event_id"]] = event
+        self.spool.write(json.dumps(event) + "\n")
+        self.spool.flush()
+
+        if len(self.events) > self.maxPending:
+            # Events are kept in play order, drop the oldest tenth at once so
+            # the spool isn't rewritten on every play while the server is away
+            dropped = len(self.events) - self.maxPending * 9 // 10
+            for eventId in list(self.events)[:dropped]:
+                del self.events[eventId]
+            print(f"Play log full, dropped {dropped} oldest events")
+            if not self.compacting:
+                self.compactSpool()
+
+    def writeSpool(self, path: Path, events: list):
+        with open(path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def swapSpool(self, tmpPath: Path):
+        self.spool.close()
+        os.replace(tmpPath, self.spoolPath)
+        self.spool = open(self.spoolPath, "a", encoding="utf-8")
+
+    def compactSpool(self):
+        # Rewrite the spool with only the events still waiting for an ack
+        tmpPath = self.spoolPath.with_suffix(".tmp")
+        self.writeSpool(tmpPath, list(self.events.values()))
+        self.swapSpool(tmpPath)
+
+    async def compactSpoolInBackground(self):
+        # Same as compactSpool, with the bulk write in ioExecutor so the GUI
+        # loop keeps rendering. Plays finished meanwhile are appended to the
+        # new file before it replaces the spool
+        self.compacting = True
+        try:
+            tmpPath = self.spoolPath.with_suffix(".tmp")
+            snapshot = dict(self.events)
+            await utils.runIo(self.writeSpool, tmpPath, list(snapshot.values()))
+            with open(tmpPath, "a", encoding="utf-8") as f:
+                for eventId, event in self.events.items():
+                    if eventId not in snapshot:
+                        f.write(json.dumps(event) + "\n")
+            self.swapSpool(tmpPath)
+        finally:
+            self.compacting = False
+
+    async def upload(self, session: aiohttp.ClientSession):
+        # Returns the number of seconds to wait before the next attempt. The
+        # spool is compacted once per pass, after every acked batch is out
+        self.acked = 0
+        try:
+            return await self.uploadBatches(session)
+        finally:
+            if self.acked:
+                await self.compactSpoolInBackground()
+
+    async def uploadBatches(self, session: aiohttp.ClientSession):
+        uploaded = 0
+        while self.events:
+            batch = list(itertools.islice(self.events.values(), self.batchSize))
+            async with session.post(
+                f"{self.apiBase}/api/play-events/",
+                json={"client_id": self.clientId, "events": batch},
+            ) as resp:
+                if resp.status == 429:
+                    retryAfter = float(resp.headers.get("Retry-After", self.uploadInterval))
+                    print(f"Play log upload pushed back, retrying in {retryAfter}s")
+                    return retryAfter
+                if resp.status != 200:
+                    print(f"Play log upload failed: HTTP {resp.status}")
+                    return self.uploadInterval
+                data = await resp.json()
+
+            for eventId in data.get("accepted", []):
+                if self.events.pop(eventId, None) is not None:
+                    self.acked += 1
+            uploaded += len(batch)
+
+        if uploaded:
+            print(f"Uploaded {uploaded} play events")
+        return self.uploadInterval
+
+    async def uploadLoop(self, session: aiohttp.ClientSession):
+        while True:
+            try:
+                delay = await self.upload(session)
+            except Exception as e:
+                print(f"Play log upload error: {e}")
+                delay = self.uploadInterval
+            await asyncio.sleep(delay)
+
+    def close(self):
+        self.finishPlay()
+        self.spool.close()
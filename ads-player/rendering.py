@@ -0,0 +1,201 @@
+# Qt/VLC rendering of ads for BillboardPlayer. Kept apart from utils so the
+# scheduling, caching and sync logic can run headless.
+import asyncio
+import os
+import platform
+from PyQt5.QtGui import QImageReader, QPixmap
+from PyQt5.QtCore import Qt
+
+from memory import LOW_MEMORY
+
+# VLC Media objects kept for reuse, least recently played evicted first
+VLC_MEDIA_CACHE = 1 if LOW_MEMORY else 4
+VLC_FILE_CACHING_MS = 300 if LOW_MEMORY else 1000
+
+
+def releaseImage(playerInstance):
+    # Drop the still image's pixmap once it leaves the screen
+    if playerInstance.currentMediaType == "image":
+        playerInstance.imageWidget.clear()
+
+
+def getVlcMedia(playerInstance, localPath: str):
+    # Reuse the Media of a video already played instead of allocating one on
+    # every start and restart; vlcMediaCache is an OrderedDict path -> Media
+    cache = playerInstance.vlcMediaCache
+    media = cache.get(localPath)
+    if media is not None:
+        cache.move_to_end(localPath)
+        return media
+
+    media = playerInstance.vlcInstance.media_new(localPath)
+    # Set comprehensive loop options for local files
+    media.add_option(":input-repeat=65535")  # Very high repeat count
+    media.add_option(":loop")
+    media.add_option(f":file-caching={VLC_FILE_CACHING_MS}")
+    cache[localPath] = media
+
+    while len(cache) > VLC_MEDIA_CACHE:
+        _, evicted = cache.popitem(last=False)
+        evicted.release()
+    return media
+
+
+def releaseVlcMedia(playerInstance):
+    while playerInstance.vlcMediaCache:
+        _, media = playerInstance.vlcMediaCache.popitem()
+        media.release()
+
+
+def imageSlider(playerInstance, localPath: str):
+    # Display image from local cache
+    print(f"Displaying image: {localPath}")
+
+    playerInstance.animatedImage.release()
+    if playerInstance.isPlayingVideo:
+        stopVideo(playerInstance)
+
+    try:
+        # Decode straight at display size, a full resolution image is never
+        # held in memory
+        reader = QImageReader(localPath)
+        reader.setAutoTransform(True)
+        scaledSize = reader.size().scaled(playerInstance.imageWidget.size(), Qt.KeepAspectRatio)
+        if scaledSize.isValid() and not scaledSize.isEmpty():
+            reader.setScaledSize(scaledSize)
+        image = reader.read()
+        if image.isNull():
+            playerInstance.imageWidget.setText("Failed to load image")
+            print(f"Image could not be loaded: {reader.errorString()}")
+        else:
+            playerInstance.imageWidget.setPixmap(QPixmap.fromImage(image))
+    except Exception as e:
+        print(f"Error displaying image: {e}")
+        playerInstance.imageWidget.setText(f"Image error: {str(e)}")
+
+    playerInstance.stackedWidget.setCurrentIndex(0)
+    playerInstance.currentMediaType = "image"
+
+
+def gifSlider(playerInstance, localPath: str):
+    # Display GIF from local cache
+    print(f"Displaying GIF: {localPath}")
+
+    releaseImage(playerInstance)
+    if playerInstance.isPlayingVideo:
+        stopVideo(playerInstance)
+
+    playerInstance.stackedWidget.setCurrentIndex(0)
+    playerInstance.currentMediaType = "gif"
+
+    # Frames are decoded off the GUI thread, playback starts when ready
+    task = asyncio.ensure_future(playerInstance.animatedImage.play(localPath))
+
+    def onGifDone(task):
+        if not task.cancelled() and task.exception():
+            print(f"Error loading GIF: {task.exception()}")
+            playerInstance.imageWidget.setText(f"GIF error: {str(task.exception())}")
+
+    task.add_done_callback(onGifDone)
+
+
+def videoplayer(playerInstance, localPath: str):
+    # Play video from local cache
+    print(f"Playing video: {localPath}")
+
+    playerInstance.animatedImage.release()
+    releaseImage(playerInstance)
+    if playerInstance.isPlayingVideo:
+        stopVideo(playerInstance)
+
+    # Check if local file exists
+    if not os.path.exists(localPath):
+        print(f"Local video file not found: {localPath}")
+        playerInstance.imageWidget.setText("Video file not found")
+        playerInstance.stackedWidget.setCurrentIndex(0)
+        return
+
+    playerInstance.stackedWidget.setCurrentIndex(1)
+    playerInstance.isPlayingVideo = True
+    playerInstance.currentVideoPath = localPath
+    playerInstance.currentMediaType = "video"
+
+    try:
+        playerInstance.vlcPlayer.set_media(getVlcMedia(playerInstance, localPath))
+
+        # Embed VLC player
+        embedVLCPlayer(playerInstance)
+
+        # Start playback
+        result = playerInstance.vlcPlayer.play()
+
+        if result == -1:
+            print("Failed to start VLC playback")
+            playerInstance.playLog.failPlay("video playback failed")
+            playerInstance.imageWidget.setText("Video playback failed")
+            playerInstance.stackedWidget.setCurrentIndex(0)
+            playerInstance.isPlayingVideo = False
+        else:
+            print("VLC playback started successfully")
+
+    except Exception as e:
+        print(f"Error in video playback: {e}")
+        playerInstance.playLog.failPlay(f"video error: {e}")
+        playerInstance.imageWidget.setText(f"Video error: {str(e)}")
+        playerInstance.stackedWidget.setCurrentIndex(0)
+        playerInstance.isPlayingVideo = False
+
+
+def embedVLCPlayer(playerInstance):
+    # Embed VLC player in the Qt widget based on platform
+    try:
+        if platform.system() == "Windows":
+            playerInstance.vlcPlayer.set_hwnd(
+                int(playerInstance.videoFrame.winId()))
+        elif platform.system() == "Linux":
+            playerInstance.vlcPlayer.set_xwindow(
+                int(playerInstance.videoFrame.winId()))
+        elif platform.system() == "Darwin":  # macOS
+            playerInstance.vlcPlayer.set_nsobject(
+                int(playerInstance.videoFrame.winId()))
+    except Exception as e:
+        print(f"Error embedding VLC player: {e}")
+
+
+def stopVideo(playerInstance):
+    # Stop video playback cleanly
+    if playerInstance.isPlayingVideo:
+        print("Stopping video playback...")
+        playerInstance.videoloopTimer.stop()
+        try:
+            playerInstance.vlcPlayer.stop()
+        except Exception as e:
+            print(f"Error stopping VLC: {e}")
+        playerInstance.isPlayingVideo = False
+        playerInstance.currentVideoPath = None
+
+
+def onVideoEnd(playerInstance):
+    # Handle video end event from VLC, delivered on the GUI thread through
+    # BillboardPlayer.videoEnded
+    print("Video ended, restarting...")
+    if playerInstance.isPlayingVideo:
+        playerInstance.videoloopTimer.start(100)  # 100ms delay
+
+
+def restartVideo(playerInstance):
+    # Restart the current video
+    playerInstance.videoloopTimer.stop()
+    if playerInstance.isPlayingVideo and playerInstance.currentVideoPath:
+        print(f"Restarting video: {playerInstance.currentVideoPath}")
+        try:
+            # Stop and restart with the same Media
+            playerInstance.vlcPlayer.stop()
+            playerInstance.vlcPlayer.set_media(
+                getVlcMedia(playerInstance, playerInstance.currentVideoPath))
+            playerInstance.vlcPlayer.play()
+
+            print("Video restarted successfully")
+
+        except Exception as e:
+            print(f"Error restarting video: {e}")
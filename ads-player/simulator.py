@@ -0,0 +1,275 @@
+# Headless virtual-billboard fleet simulator for load testing the backend.
+#
+# Each virtual billboard runs the real PlayerCore logic (schedule fetch,
+# media caching, WebSocket sync, proof-of-play uploads) as an asyncio task,
+# with media served by a local stand-in instead of Cloudinary. For every
+# fleet size the simulator creates probe schedules through the API and
+# measures how long the notification takes to reach each billboard.
+#
+#   python simulator.py --fleet 100,500,1000 --server-pid <uvicorn pid>
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from core import PlayerCore
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def report(text: str = ""):
+    # The fleet's own logging is silenced, results go to the real stdout
+    print(text, file=sys.__stdout__, flush=True)
+
+
+class MediaStandIn:
+    # Local HTTP server answering every /media/<name> with `mediaBytes` of data
+    def __init__(self, mediaBytes: int):
+        self.payload = os.urandom(mediaBytes)
+        self.runner = None
+        self.baseUrl = None
+
+    async def handle(self, request):
+        return web.Response(body=self.payload, content_type="application/octet-stream")
+
+    def makeApp(self):
+        app = web.Application()
+        app.router.add_get("/media/{name}", self.handle)
+        return app
+
+    async def start(self):
+        self.runner = web.AppRunner(self.makeApp(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.baseUrl = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class VirtualBillboard(PlayerCore):
+    # The stand-in serves placeholder bytes, not the ads' real media
+    verifyDownloads = False
+
+    def __init__(self, index: int, args, workDir: Path, session, mediaBase: str):
+        clientId = f"sim-{index}"
+        super().__init__(
+            apiBase=args.api,
+            wsBase=args.ws,
+            clientId=clientId,
+            cacheDir=workDir / clientId / "media_cache",
+            playLogPath=workDir / clientId / "playlog.jsonl",
+        )
+        self.session = session
+        self.mediaBase = mediaBase
+        self.speed = args.speed
+        self.playLog.uploadInterval = args.upload_interval
+        # schedule id -> perf_counter() when its change notification arrived
+        self.receivedAt = {}
+
+    def mediaSourceUrl(self, url: str) -> str:
+        return f"{self.mediaBase}/media/{hashlib.md5(url.encode()).hexdigest()}"
+
+    async def handleMessage(self, message):
+        if isinstance(message, dict) and message.get("type") == "schedules_changed":
+            receivedAt = time.perf_counter()
+            for scheduleId in message.get("schedule_ids", []):
+                self.receivedAt[scheduleId] = receivedAt
+        await super().handleMessage(message)
+
+    async def rotate(self):
+        # Headless rotation: same nextSchedule() as the Qt player, no rendering
+        while True:
+            nextItem = self.nextSchedule()
+            if nextItem is None:
+                await asyncio.sleep(1)
+                continue
+            schedule, localPath, duration = nextItem
+            if schedule is not None:
+                self.playLog.startPlay(schedule)
+            else:
+                self.playLog.finishPlay()
+            await asyncio.sleep(duration / 1000 / self.speed)
+
+    async def runTasks(self):
+        await self.loadSchedules()
+        await asyncio.gather(
+            self.listenWs(),
+            self.rotate(),
+            self.playLog.uploadLoop(self.session),
+        )
+
+
+def percentile(values: list, p: float):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def processTreeUsage(pid: int):
+    # (cpu seconds, rss bytes) of the server process and its direct children
+    # (uvicorn workers), read from /proc
+    pids = [pid]
+    for entry in Path("/proc").iterdir():
+        if entry.name.isdigit():
+            try:
+                fields = (entry / "stat").read_text().rsplit(")", 1)[1].split()
+                if int(fields[1]) == pid:
+                    pids.append(int(entry.name))
+            except (OSError, IndexError, ValueError):
+                continue
+
+    cpuSeconds = 0.0
+    rssBytes = 0
+    for p in pids:
+        try:
+            fields = Path(f"/proc/{p}/stat").read_text().rsplit(")", 1)[1].split()
+            cpuSeconds += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            rssBytes += int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return cpuSeconds, rssBytes
+
+
+async def resolveTargets(session, args):
+    # Ad and billboard used for probe schedules
+    adId, billboardId = args.ad_id, args.billboard_id
+    if adId is None:
+        async with session.get(f"{args.api}/api/ads/?limit=1") as resp:
+            ads = await resp.json()
+        if not ads:
+            raise SystemExit("No ads on the server, upload one or pass --ad-id")
+        adId = ads[0]["id"]
+    if billboardId is None:
+        async with session.post(f"{args.api}/api/billboards/", json={"name": "Fleet simulator", "location": "simulator"}) as resp:
+            billboardId = (await resp.json())["id"]
+    return adId, billboardId
+
+
+async def probe(session, args, fleet, adId, billboardId):
+    # Create one schedule and return per-billboard propagation latencies
+    now = datetime.utcnow()
+    body = {
+        "billboard_id": billboardId,
+        "ad_id": adId,
+        "start_time": (now - timedelta(minutes=1)).isoformat(),
+        "end_time": (now + timedelta(minutes=args.probe_ttl)).isoformat(),
+        "duration": 10,
+    }
+    sentAt = time.perf_counter()
+    async with session.post(f"{args.api}/api/schedules/", json=body) as resp:
+        scheduleId = (await resp.json())["id"]
+
+    deadline = sentAt + args.timeout
+    while time.perf_counter() < deadline:
+        if all(scheduleId in b.receivedAt for b in fleet):
+            break
+        await asyncio.sleep(0.01)
+    return [b.receivedAt[scheduleId] - sentAt for b in fleet if scheduleId in b.receivedAt]
+
+
+async def runFleet(size: int, args, session, standIn, adId, billboardId):
+    workDir = Path(tempfile.mkdtemp(prefix=f"adsync-sim-{size}-"))
+    fleet = [VirtualBillboard(i, args, workDir, session, standIn.baseUrl) for i in range(size)]
+    usageBefore = processTreeUsage(args.server_pid) if args.server_pid else None
+    startedAt = time.perf_counter()
+
+    tasks = []
+    for billboard in fleet:
+        tasks.append(asyncio.create_task(billboard.runTasks()))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / size)
+
+    # Wait for the fleet to hold its WebSockets
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline and sum(b.ws is not None for b in fleet) < size:
+        await asyncio.sleep(0.1)
+    connected = sum(b.ws is not None for b in fleet)
+
+    latencies = []
+    for _ in range(args.probes):
+        latencies += await probe(session, args, fleet, adId, billboardId)
+        await asyncio.sleep(args.probe_interval)
+
+    elapsed = time.perf_counter() - startedAt
+    expected = size * args.probes
+    row = (
+        f"{size:>6} {connected:>9} "
+        f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 90) * 1000:>8.1f} "
+        f"{percentile(latencies, 99) * 1000:>8.1f} {max(latencies, default=float('nan')) * 1000:>8.1f} "
+        f"{expected - len(latencies):>6}"
+    )
+    if usageBefore:
+        cpuAfter, rssAfter = processTreeUsage(args.server_pid)
+        cpuPercent = (cpuAfter - usageBefore[0]) / elapsed * 100
+        row += f" {cpuPercent:>7.1f} {rssAfter / 1024 / 1024:>8.1f}"
+    report(row)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # The session is shared by the whole fleet, so not shutdown()
+    for billboard in fleet:
+        await billboard.stopBackground()
+        billboard.playLog.close()
+    shutil.rmtree(workDir, ignore_errors=True)
+
+
+async def main(args):
+    standIn = MediaStandIn(args.media_kb * 1024)
+    await standIn.start()
+    connector = aiohttp.TCPConnector(limit=0)
+    session = aiohttp.ClientSession(connector=connector)
+
+    # Thousands of billboards logging every step would swamp the report
+    sys.stdout = open(os.devnull, "w")
+    try:
+        adId, billboardId = await resolveTargets(session, args)
+        report(f"Probing with ad {adId} on billboard {billboardId}, {args.probes} probes per fleet size")
+        header = f"{'fleet':>6} {'connected':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'missed':>6}"
+        if args.server_pid:
+            header += f" {'cpu %':>7} {'rss MB':>8}"
+        report(header)
+        for size in args.fleet:
+            await runFleet(size, args, session, standIn, adId, billboardId)
+    finally:
+        await session.close()
+        await standIn.stop()
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Virtual billboard fleet simulator")
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--ws", default="ws://127.0.0.1:8000")
+    parser.add_argument("--fleet", default="10,100,1000",
+                        type=lambda value: [int(size) for size in value.split(",")],
+                        help="comma separated fleet sizes")
+    parser.add_argument("--probes", type=int, default=5)
+    parser.add_argument("--probe-interval", type=float, default=1)
+    parser.add_argument("--probe-ttl", type=int, default=5, help="minutes a probe schedule stays active")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which the fleet connects")
+    parser.add_argument("--speed", type=float, default=1, help="rotation speed-up factor")
+    parser.add_argument("--upload-interval", type=float, default=10)
+    parser.add_argument("--media-kb", type=int, default=256)
+    parser.add_argument("--ad-id", type=int)
+    parser.add_argument("--billboard-id", type=int)
+    parser.add_argument("--server-pid", type=int, help="uvicorn master pid for CPU/RSS sampling")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parseArgs()))
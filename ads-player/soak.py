@@ -0,0 +1,168 @@
+# Memory soak test for the player logic. Drives a headless billboard (the
+# simulator's VirtualBillboard, i.e. the real PlayerCore) through simulated
+# days of rotation, playlist changes, prefetch hints, heartbeats and
+# proof-of-play uploads against a local stand-in server, sampling RSS every
+# simulated hour. Fails when memory keeps growing after the warm-up.
+#
+#   python soak.py --days 7 --max-growth-mb 8
+import argparse
+import asyncio
+import gc
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from clocksync import wallClockMs
+from memory import MemoryTracker
+from simulator import MediaStandIn, VirtualBillboard, percentile, report
+
+HOUR_MS = 3600 * 1000
+
+
+class SoakStandIn(MediaStandIn):
+    # Media stand-in that also acknowledges every uploaded play event
+    async def acceptPlayEvents(self, request):
+        body = await request.json()
+        return web.json_response({"accepted": [event["event_id"] for event in body["events"]]})
+
+    def makeApp(self):
+        app = super().makeApp()
+        app.router.add_post("/api/play-events/", self.acceptPlayEvents)
+        return app
+
+
+def makePlaylist(day: int, hour: int, args) -> list:
+    # Hourly playlist of `--playlist` ads drawn from a pool that drifts with
+    # the simulated day, so old media keeps leaving the rotation
+    rng = random.Random(day * 24 + hour)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    schedules = []
+    for slot in range(args.playlist):
+        adId = day * args.pool // 2 + rng.randrange(args.pool)
+        schedules.append({
+            "id": (day * 24 + hour) * args.playlist + slot,
+            "billboard_id": 1,
+            "ad_id": adId,
+            "start_time": (now - timedelta(hours=1)).isoformat(),
+            "end_time": (now + timedelta(days=1)).isoformat(),
+            "duration": args.ad_seconds,
+            "ad": {"file_path": f"https://media.example/ads/{adId}.mp4", "file_type": "video/mp4"},
+        })
+    return schedules
+
+
+async def advanceClock(billboard, simulatedMs: float):
+    # Heartbeat ack placing the server clock `simulatedMs` ahead of the wall
+    # clock, so time-based expiry (prefetch hints) follows simulated time
+    t0 = wallClockMs()
+    await billboard.handleMessage({"type": "heartbeat_ack", "t0": t0, "t1": t0 + simulatedMs, "t2": t0 + simulatedMs})
+
+
+def prefetchHints(billboard, day: int, args) -> list:
+    startMs = billboard.clock.now() + 2 * HOUR_MS
+    startTime = datetime.fromtimestamp(startMs / 1000, timezone.utc).replace(tzinfo=None)
+    return [
+        {"schedule_id": -adId, "url": f"https://media.example/ads/{adId}.mp4",
+         "file_type": "video/mp4", "start_time": startTime.isoformat()}
+        for adId in range((day + 1) * args.pool // 2, (day + 1) * args.pool // 2 + 3)
+    ]
+
+
+async def simulateHour(billboard, day: int, hour: int, args):
+    hourStartMs = (day * 24 + hour) * HOUR_MS
+    await advanceClock(billboard, hourStartMs)
+    await billboard.applySchedules(makePlaylist(day, hour, args))
+    if hour % 6 == 0:
+        await billboard.handleMessage({"type": "prefetch", "assets": prefetchHints(billboard, day, args)})
+
+    # Let this hour's downloads land before rotating
+    pending = [job.future for job in list(billboard.downloads.queued.values()) + list(billboard.downloads.running.values())]
+    if pending:
+        await asyncio.wait(pending, timeout=args.timeout)
+
+    playedMs = 0
+    heartbeatMs = 0
+    while playedMs < HOUR_MS:
+        nextItem = billboard.nextSchedule()
+        if nextItem is None:
+            break
+        schedule, localPath, duration = nextItem
+        if schedule is not None:
+            billboard.playLog.startPlay(schedule)
+        else:
+            billboard.playLog.finishPlay()
+        playedMs += duration
+        if playedMs - heartbeatMs >= 5000:
+            heartbeatMs = playedMs
+            await advanceClock(billboard, hourStartMs + playedMs)
+    await billboard.playLog.upload(billboard.getSession())
+
+
+async def main(args):
+    standIn = SoakStandIn(args.media_kb * 1024)
+    await standIn.start()
+    session = aiohttp.ClientSession()
+    workDir = Path(tempfile.mkdtemp(prefix="adsync-soak-"))
+
+    # The billboard logs every play, keep the report readable
+    sys.stdout = open(os.devnull, "w")
+    simArgs = argparse.Namespace(api=standIn.baseUrl, ws="ws://127.0.0.1:9", speed=1, upload_interval=3600)
+    billboard = VirtualBillboard(0, simArgs, workDir, session, standIn.baseUrl)
+    # Sequential rotation: simulated time runs far ahead of the wall clock
+    billboard.syncPlayback = False
+    tracker = MemoryTracker()
+
+    samples = []
+    try:
+        report(f"Soaking {args.days} simulated days, {args.playlist} ads x {args.ad_seconds}s per playlist")
+        report(f"{'day':>4} {'rss MB':>8} {'cached':>7} {'files':>6} {'pending':>8}")
+        for day in range(args.days):
+            for hour in range(24):
+                await simulateHour(billboard, day, hour, args)
+                gc.collect()
+                samples.append((day, tracker.sample()))
+            cacheFiles = sum(1 for _ in billboard.cacheDir.iterdir())
+            report(f"{day:>4} {tracker.last / 1024 / 1024:>8.1f} {len(billboard.cachedMedia):>7} "
+                   f"{cacheFiles:>6} {len(billboard.playLog.events):>8}")
+    finally:
+        await billboard.shutdown()
+        await standIn.stop()
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    # Compare the median RSS of the first day after warm-up with the last day
+    settled = [rss for day, rss in samples if day == args.warmup_days]
+    final = [rss for day, rss in samples if day == args.days - 1]
+    growthMb = (percentile(final, 50) - percentile(settled, 50)) / 1024 / 1024
+    report(f"RSS growth after warm-up: {growthMb:+.1f} MB (limit {args.max_growth_mb} MB), {tracker.summary()}")
+    if growthMb > args.max_growth_mb:
+        report("FAIL: memory keeps growing")
+        return 1
+    report("OK: flat memory profile")
+    return 0
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Player memory soak test")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--warmup-days", type=int, default=1)
+    parser.add_argument("--playlist", type=int, default=20, help="ads per playlist")
+    parser.add_argument("--pool", type=int, default=40, help="distinct ads in rotation per day")
+    parser.add_argument("--ad-seconds", type=float, default=10)
+    parser.add_argument("--media-kb", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-growth-mb", type=float, default=8)
+    args = parser.parse_args()
+    if args.days <= args.warmup_days:
+        parser.error("--days must be larger than --warmup-days")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parseArgs())))
@@ -1,94 +1,240 @@
 import aiohttp
-import platform
+import asyncio
+import json
 import os
 import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime, timezone
 import isodate
-from PyQt5.QtGui import QPixmap, QMovie
-from PyQt5.QtCore import Qt
 import requests
 
+# MessagePack is optional; without it the server keeps sending JSON text
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-API_BASE = "http://127.0.0.1:8000"
-WS_URL = "ws://127.0.0.1:8000/ws/client?client_id=raspi-1"
 
+WS_SUBPROTOCOL_MSGPACK = "adsync.msgpack"
 
-async def downloadMedia(playerInstance, url: str, progressCallback=None) -> str:
-    # Download media file to local cache
-    cacheFilename = getCacheFilename(url)
+# Disk I/O, hashing and cache housekeeping run here, never on the qasync loop
+ioExecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="media-io")
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+WRITE_BUFFER_BYTES = 1024 * 1024
+PROGRESS_FPS = 4
+
+
+def runIo(fn, *args):
+    return asyncio.get_running_loop().run_in_executor(ioExecutor, fn, *args)
+
+
+class MediaFileWriter:
+    # Writes a download to "<name>.part" and hashes it as it goes; finish()
+    # atomically renames it into place. All methods run in ioExecutor.
+    def __init__(self, cachePath: Path):
+        self.cachePath = cachePath
+        self.partPath = cachePath.with_name(cachePath.name + ".part")
+        self.file = None
+        self.sha256 = hashlib.sha256()
+
+    def open(self, resume: bool = False):
+        if resume:
+            # Seed the hash with the bytes fetched before the interruption
+            with open(self.partPath, "rb") as existing:
+                for block in iter(lambda: existing.read(WRITE_BUFFER_BYTES), b""):
+                    self.sha256.update(block)
+            self.file = open(self.partPath, "ab")
+        else:
+            self.file = open(self.partPath, "wb")
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.sha256.update(data)
+
+    def suspend(self):
+        # Keep the .part file so the download can resume with a Range request
+        self.file.close()
+
+    def finish(self, expectedSha256: str = None) -> str:
+        self.file.close()
+        digest = self.sha256.hexdigest()
+        if expectedSha256 and digest != expectedSha256:
+            raise ValueError(f"sha256 mismatch: got {digest[:12]}, expected {expectedSha256[:12]}")
+        os.replace(self.partPath, self.cachePath)
+        return digest
+
+    def abort(self):
+        if self.file and not self.file.closed:
+            self.file.close()
+        if self.partPath.exists():
+            self.partPath.unlink()
+
+
+class DownloadPreempted(Exception):
+    # Raised by downloadMedia when shouldYield() asks it to give way
+    pass
+
+
+class ProgressThrottle:
+    # Coalesces progress callbacks to at most `fps` UI updates per second
+    def __init__(self, callback, fps: float = PROGRESS_FPS):
+        self.callback = callback
+        self.interval = 1 / fps
+        self.lastUpdate = 0
+
+    def __call__(self, progress: float, filename: str):
+        now = time.monotonic()
+        if progress >= 100 or now - self.lastUpdate >= self.interval:
+            self.lastUpdate = now
+            self.callback(progress, filename)
+
+
+def cachedFileSize(cachePath: Path) -> int:
+    return cachePath.stat().st_size if cachePath.exists() else 0
+
+
+def wsProtocols():
+    # Subprotocols offered in the WebSocket handshake
+    return (WS_SUBPROTOCOL_MSGPACK,) if msgpack else ()
+
+
+def decodeWsMessage(msg):
+    # Decode a JSON text frame or a MessagePack binary frame
+    if msg.type == aiohttp.WSMsgType.BINARY:
+        return msgpack.unpackb(msg.data, raw=False)
+    return json.loads(msg.data)
+
+
+async def downloadMedia(playerInstance, url: str, progressCallback=None,
+                        rateLimiter=None, shouldYield=None) -> str:
+    # Download media file to local cache. Chunks are gathered into large
+    # buffers and written/hashed in ioExecutor so the Qt loop stays free.
+    # rateLimiter throttles the transfer; when shouldYield() turns true the
+    # partial file is kept and DownloadPreempted raised, a later call resumes.
+    # Size and sha256 from the ad's metadata, when known, are verified.
+    media = playerInstance.mediaInfo.get(url) or {}
+    expectedSize = media.get("size_bytes") if playerInstance.verifyDownloads else None
+    expectedSha256 = media.get("sha256") if playerInstance.verifyDownloads else None
+    cacheFilename = await runIo(cacheFilenameFor, playerInstance, url)
     cachePath = playerInstance.cacheDir / cacheFilename
 
     # Return cached file if it exists and is valid
-    if cachePath.exists() and cachePath.stat().st_size > 0:
+    cachedSize = await runIo(cachedFileSize, cachePath)
+    if cachedSize > 0 and (not expectedSize or cachedSize == expectedSize):
         print(f"Using cached file: {cacheFilename}")
         return str(cachePath)
+    if cachedSize > 0:
+        print(f"Cached file {cacheFilename} has {cachedSize} bytes, expected {expectedSize}, downloading again")
 
     print(f"Downloading: {url} -> {cacheFilename}")
+    writer = MediaFileWriter(cachePath)
+    if progressCallback:
+        progressCallback = ProgressThrottle(progressCallback)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    print(
-                        f"Failed to download {url}: HTTP {response.status}")
-                    return None
-
-                totalSize = int(response.headers.get('content-length', 0))
-                downloaded = 0
-
-                with open(cachePath, 'wb') as f:
-                    async for chunk in response.content.iter_chunked(8192):
-                        f.write(chunk)
-                        downloaded += len(chunk)
-
-                        if progressCallback and totalSize > 0:
-                            progress = (downloaded / totalSize) * 100
-                            progressCallback(progress, cacheFilename)
+        partSize = await runIo(cachedFileSize, writer.partPath)
+        headers = {"Range": f"bytes={partSize}-"} if partSize else {}
+
+        session = playerInstance.getSession()
+        async with session.get(playerInstance.mediaSourceUrl(url), headers=headers) as response:
+            if response.status not in (200, 206):
+                print(
+                    f"Failed to download {url}: HTTP {response.status}")
+                return None
+
+            # 206: the server honoured the Range request, append to the part
+            resume = response.status == 206
+            downloaded = partSize if resume else 0
+            totalSize = downloaded + int(response.headers.get('content-length', 0))
+            buffer = bytearray()
+
+            await runIo(writer.open, resume)
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_BYTES):
+                if rateLimiter:
+                    await rateLimiter.acquire(len(chunk))
+                buffer += chunk
+                downloaded += len(chunk)
+                if len(buffer) >= WRITE_BUFFER_BYTES:
+                    await runIo(writer.write, bytes(buffer))
+                    buffer.clear()
+
+                if shouldYield and shouldYield():
+                    if buffer:
+                        await runIo(writer.write, bytes(buffer))
+                    await runIo(writer.suspend)
+                    print(f"Download preempted: {cacheFilename} at {downloaded} bytes")
+                    raise DownloadPreempted(url)
+
+                if progressCallback and totalSize > 0:
+                    progress = (downloaded / totalSize) * 100
+                    progressCallback(progress, cacheFilename)
+
+            if buffer:
+                await runIo(writer.write, bytes(buffer))
+            if expectedSize and downloaded != expectedSize:
+                raise ValueError(f"size mismatch: got {downloaded} bytes, expected {expectedSize}")
+            digest = await runIo(writer.finish, expectedSha256)
 
         print(
-            f"Downloaded successfully: {cacheFilename} ({cachePath.stat().st_size} bytes)")
+            f"Downloaded successfully: {cacheFilename} ({downloaded} bytes, sha256 {digest[:12]})")
         return str(cachePath)
 
+    except DownloadPreempted:
+        raise
+
     except Exception as e:
         print(f"Error downloading {url}: {e}")
         # Clean up partial download
-        if cache_path.exists():
-            cache_path.unlink()
+        await runIo(writer.abort)
         return None
 
 
+def showCacheStatus(playerInstance, text: str):
+    # Caching status goes on screen only while no ad is playing; a background
+    # re-cache after a schedule update must not cover the current ad
+    if playerInstance.isShowingAd():
+        return
+    playerInstance.showStatus(text)
+
+
 def updateDownloadProgress(playerInstance, progress: float, filename: str):
     # Update UI with download progress
-    playerInstance.imageWidget.setText(
+    showCacheStatus(playerInstance,
         f"Downloading {filename}\n{progress:.1f}%")
 
 
+def getExtensionFromType(contentType: str) -> str:
+    contentType = (contentType or "").lower()
+    if 'image/jpeg' in contentType or 'image/jpg' in contentType:
+        return '.jpg'
+    elif 'image/png' in contentType:
+        return '.png'
+    elif 'image/gif' in contentType:
+        return '.gif'
+    elif 'video/mp4' in contentType:
+        return '.mp4'
+    elif 'video/avi' in contentType:
+        return '.avi'
+    elif 'video/mov' in contentType or 'video/quicktime' in contentType:
+        return '.mov'
+    else:
+        return '.tmp'
+
+
 def getExtensionFromUrl(url: str) -> str:
     # Get file extension based on URL or content type
     try:
         response = requests.head(url, timeout=10)
-        contentType = response.headers.get('content-type', '').lower()
-
-        if 'image/jpeg' in contentType or 'image/jpg' in contentType:
-            return '.jpg'
-        elif 'image/png' in contentType:
-            return '.png'
-        elif 'image/gif' in contentType:
-            return '.gif'
-        elif 'video/mp4' in contentType:
-            return '.mp4'
-        elif 'video/avi' in contentType:
-            return '.avi'
-        elif 'video/mov' in contentType:
-            return '.mov'
-        else:
-            return '.tmp'
+        return getExtensionFromType(response.headers.get('content-type', ''))
     except:
         return '.tmp'
 
 
-def getCacheFilename(url: str) -> str:
+@lru_cache(maxsize=1024)
+def getCacheFilename(url: str, fileType: str = None) -> str:
     # Generate cache filename from URL
     # Create hash of URL for unique filename
     urlHash = hashlib.md5(url.encode()).hexdigest()
@@ -97,60 +243,58 @@ def getCacheFilename(url: str) -> str:
     try:
         extension = Path(url).suffix
         if not extension or len(extension) > 5:
-            # Fallback to content-type based extension
-            extension = getExtensionFromUrl(url)
+            # Fallback to the ad's file_type, then to a HEAD request
+            extension = getExtensionFromType(fileType) if fileType else getExtensionFromUrl(url)
     except:
         extension = ""
 
     return f"{urlHash}{extension}"
 
 
-async def cacheAllMedia(playerInstance, schedules):
-    # Pre-download all media files for active schedules
-    print("Starting media caching...")
-    playerInstance.imageWidget.setText("Caching media files...")
+def cacheFilenameFor(playerInstance, url: str) -> str:
+    # Blocking when the type is unknown (HEAD request), run it through runIo
+    fileType = (playerInstance.mediaInfo.get(url) or {}).get("file_type")
+    return getCacheFilename(url, fileType)
 
-    downloadTasks = []
-    mediaUrls = set()
 
-    # Collect all unique media URLs
-    for schedule in schedules:
-        adData = schedule.get("ad", {})
-        mediaUrl = adData.get("file_path")
-        if mediaUrl and mediaUrl not in mediaUrls:
-            mediaUrls.add(mediaUrl)
+def findCachedMedia(playerInstance, url: str, cacheFilename: str):
+    # Path of a complete cached copy of `url`, or None. Blocking, run it
+    # through runIo
+    media = playerInstance.mediaInfo.get(url) or {}
+    expectedSize = media.get("size_bytes") if playerInstance.verifyDownloads else None
+    cachePath = playerInstance.cacheDir / cacheFilename
+    cachedSize = cachedFileSize(cachePath)
+    if cachedSize > 0 and (not expectedSize or cachedSize == expectedSize):
+        return str(cachePath)
+    return None
 
-    print(f"Found {len(mediaUrls)} unique media files to cache")
 
-    # Download all media files
-    cachedCount = 0
-    for i, url in enumerate(mediaUrls, 1):
-        try:
-            playerInstance.imageWidget.setText(
-                f"Caching media {i}/{len(mediaUrls)}")
-
-            localPath = await downloadMedia(
-                playerInstance,
-                url,
-                lambda p, f: updateDownloadProgress(playerInstance, p, f)
-            )
-
-            if localPath:
-                playerInstance.cachedMedia[url] = localPath
-                cachedCount += 1
-                print(f"Cached: {url} -> {localPath}")
-            else:
-                print(f"Failed to cache: {url}")
+async def cacheAllMedia(playerInstance, schedules, startIndex: int = 0):
+    # Queue the media of `schedules` on the download scheduler, ordered by
+    # when each file first plays from startIndex. Ads join the rotation as
+    # their own file lands (PlayerCore.nextSchedule skips the others), so
+    # this only waits until one file of the playlist is playable. True once
+    # one is, False when every download failed.
+    print("Starting media caching...")
+    showCacheStatus(playerInstance, "Caching media files...")
 
-        except Exception as e:
-            print(f"Error caching {url}: {e}")
+    futures = playerInstance.downloads.fetchPlaylist(schedules, startIndex)
+    print(f"Found {len(futures)} unique media files to cache")
+
+    ready = any(playerInstance.localMediaFor(schedule) for schedule in schedules)
+    waiting = set(futures.values())
+    while not ready and waiting:
+        done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+        ready = any(not future.cancelled() and future.result() for future in done)
 
+    cachedCount = sum(url in playerInstance.cachedMedia for url in futures)
+    pending = sum(not future.done() for future in futures.values())
     print(
-        f"Media caching complete: {cachedCount}/{len(mediaUrls)} files cached")
-    playerInstance.imageWidget.setText(
-        f"Cached {cachedCount}/{len(mediaUrls)} media files")
+        f"Media caching: {cachedCount}/{len(futures)} files ready, {pending} downloading")
+    showCacheStatus(playerInstance,
+        f"Cached {cachedCount}/{len(futures)} media files")
 
-    return cachedCount > 0
+    return ready
 
 
 def getLocalMediaPath(playerInstance, url: str) -> str:
@@ -159,35 +303,54 @@ def getLocalMediaPath(playerInstance, url: str) -> str:
     return playerInstance.cachedMedia.get(url, url)
 
 
-def cleanupOldCache(playerInstance):
-    # Remove cached files that are no longer needed
+def removeCacheFiles(paths) -> tuple:
+    # Delete files that exist among `paths`; returns (freedBytes, filesRemoved)
+    freedBytes = 0
+    removed = 0
+    for path in paths:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        freedBytes += size
+        removed += 1
+    return freedBytes, removed
+
+
+def cleanupOldCache(playerInstance, currentFiles: set = None) -> tuple:
+    # Remove cached files that are no longer needed. Blocking, run it through
+    # runIo with a snapshot of the cached paths. Returns (freedBytes, filesRemoved)
     try:
-        currentFiles = set(playerInstance.cachedMedia.values())
+        if currentFiles is None:
+            currentFiles = set(playerInstance.cachedMedia.values())
 
-        for cacheFile in playerInstance.cacheDir.glob("*"):
-            if str(cacheFile) not in currentFiles:
-                print(f"Removing old cache file: {cacheFile.name}")
-                cacheFile.unlink()
+        stale = [cacheFile for cacheFile in playerInstance.cacheDir.glob("*")
+                 if str(cacheFile) not in currentFiles]
+        for cacheFile in stale:
+            print(f"Removing old cache file: {cacheFile.name}")
+        return removeCacheFiles(stale)
 
     except Exception as e:
         print(f"Error cleaning cache: {e}")
+        return 0, 0
 
 
 async def fetchSchedules(playerInstance):
     print("Fetching schedules...")
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{API_BASE}/api/schedules?skip=0&limit=50") as resp:
-                if resp.status != 200:
-                    print(f"Error fetching schedules: {resp.status}")
-                    playerInstance.imageWidget.setText(
-                        f"Error fetching schedules: {resp.status}")
-                    return []
-                data = await resp.json()
-                return data
+        session = playerInstance.getSession()
+        async with session.get(f"{playerInstance.apiBase}/api/schedules?skip=0&limit=50") as resp:
+            if resp.status != 200:
+                print(f"Error fetching schedules: {resp.status}")
+                playerInstance.showStatus(
+                    f"Error fetching schedules: {resp.status}")
+                return []
+            data = await resp.json()
+            return data
     except Exception as e:
         print(f"Error fetching schedules: {e}")
-        playerInstance.imageWidget.setText(f"Network error: {str(e)}")
+        playerInstance.showStatus(f"Network error: {str(e)}")
         return []
 
 
@@ -227,166 +390,3 @@ def formatDuration(rawDuration):
             except ValueError:
                 durationSeconds = 10
     return int(durationSeconds * 1000)
-
-
-def imageSlider(playerInstance, localPath: str):
-    # Display image from local cache
-    print(f"Displaying image: {localPath}")
-
-    if playerInstance.isPlayingVideo:
-        stopVideo(playerInstance)
-
-    try:
-        pixmap = QPixmap(localPath)
-        if pixmap.isNull():
-            playerInstance.imageWidget.setText("Failed to load image")
-            print("Image could not be loaded.")
-        else:
-            scaledPixmap = pixmap.scaled(
-                playerInstance.imageWidget.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            playerInstance.imageWidget.setPixmap(scaledPixmap)
-    except Exception as e:
-        print(f"Error displaying image: {e}")
-        playerInstance.imageWidget.setText(f"Image error: {str(e)}")
-
-    playerInstance.stackedWidget.setCurrentIndex(0)
-    playerInstance.currentMediaType = "image"
-
-
-def gifSlider(playerInstance, localPath: str):
-    # Display GIF from local cache
-    print(f"Displaying GIF: {localPath}")
-
-    if playerInstance.isPlayingVideo:
-        stopVideo(playerInstance)
-
-    try:
-        movie = QMovie(localPath)
-        if not movie.isValid():
-            playerInstance.imageWidget.setText("Invalid GIF")
-            print("Invalid GIF data")
-            return
-
-        playerInstance.imageWidget.setMovie(movie)
-        movie.start()
-    except Exception as e:
-        print(f"Error loading GIF: {e}")
-        playerInstance.imageWidget.setText(f"GIF error: {str(e)}")
-
-
-def videoplayer(playerInstance, localPath: str):
-    # Play video from local cache
-    print(f"Playing video: {localPath}")
-
-    if playerInstance.isPlayingVideo:
-        stopVideo(playerInstance)
-
-    # Check if local file exists
-    if not os.path.exists(localPath):
-        print(f"Local video file not found: {localPath}")
-        playerInstance.imageWidget.setText("Video file not found")
-        playerInstance.stackedWidget.setCurrentIndex(0)
-        return
-
-    playerInstance.stackedWidget.setCurrentIndex(1)
-    playerInstance.isPlayingVideo = True
-    playerInstance.currentVideoPath = localPath
-    playerInstance.currentMediaType = "video"
-
-    try:
-        # Create media from local file
-        media = playerInstance.vlcInstance.media_new(localPath)
-
-        # Set comprehensive loop options for local files
-        media.add_option(":input-repeat=65535")  # Very high repeat count
-        media.add_option(":loop")
-        # 1 second cache for smooth playback
-        media.add_option(":file-caching=1000")
-
-        playerInstance.vlcPlayer.set_media(media)
-
-        # Embed VLC player
-        embedVLCPlayer(playerInstance)
-
-        # Start playback
-        result = playerInstance.vlcPlayer.play()
-
-        if result == -1:
-            print("Failed to start VLC playback")
-            playerInstance.imageWidget.setText("Video playback failed")
-            playerInstance.stackedWidget.setCurrentIndex(0)
-            playerInstance.isPlayingVideo = False
-        else:
-            print("VLC playback started successfully")
-
-    except Exception as e:
-        print(f"Error in video playback: {e}")
-        playerInstance.imageWidget.setText(f"Video error: {str(e)}")
-        playerInstance.stackedWidget.setCurrentIndex(0)
-        playerInstance.isPlayingVideo = False
-
-
-def embedVLCPlayer(playerInstance):
-    # Embed VLC player in the Qt widget based on platform
-    try:
-        if platform.system() == "Windows":
-            playerInstance.vlcPlayer.set_hwnd(
-                int(playerInstance.videoFrame.winId()))
-        elif platform.system() == "Linux":
-            playerInstance.vlcPlayer.set_xwindow(
-                int(playerInstance.videoFrame.winId()))
-        elif platform.system() == "Darwin":  # macOS
-            playerInstance.vlcPlayer.set_nsobject(
-                int(playerInstance.videoFrame.winId()))
-    except Exception as e:
-        print(f"Error embedding VLC player: {e}")
-
-
-def stopVideo(playerInstance):
-    # Stop video playback cleanly
-    if playerInstance.isPlayingVideo:
-        print("Stopping video playback...")
-        playerInstance.videoloopTimer.stop()
-        try:
-            playerInstance.vlcPlayer.stop()
-        except Exception as e:
-            print(f"Error stopping VLC: {e}")
-        playerInstance.isPlayingVideo = False
-        playerInstance.currentVideoPath = None
-
-
-def onVideoEnd(playerInstance):
-    # Handle video end event from VLC
-    print("Video ended, restarting...")
-    if playerInstance.isPlayingVideo:
-        playerInstance.videoloopTimer.start(100)  # 100ms delay
-
-
-def restartVideo(playerInstance):
-    # Restart the current video
-    playerInstance.videoloopTimer.stop()
-    if playerInstance.isPlayingVideo and playerInstance.currentVideoPath:
-        print(f"Restarting video: {playerInstance.currentVideoPath}")
-        try:
-            # Stop and restart with local file
-            playerInstance.vlcPlayer.stop()
-
-            # Create media from local file path
-            media = playerInstance.vlcInstance.media_new(
-                playerInstance.currentVideoPath)
-
-            # Set loop options for local playback
-            # Large number for infinite loop
-            media.add_option(":input-repeat=65535")
-            media.add_option(":loop")
-
-            playerInstance.vlcPlayer.set_media(media)
-            playerInstance.vlcPlayer.play()
-
-            print("Video restarted successfully")
-
-        except Exception as e:
-            print(f"Error restarting video: {e}")
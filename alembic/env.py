@@ -6,7 +6,7 @@ from sqlalchemy import pool
 from alembic import context
 
 from server.database import Base
-from server import models
+from server import config as serverConfig, models
 # import sys
 # import os
 
@@ -25,6 +25,11 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Migrate the database the server uses; the URL in alembic.ini is only a
+# fallback for when DATABASE_URL isn't set. "%" is escaped for configparser
+if serverConfig.DATABASE_URL:
+    config.set_main_option("sqlalchemy.url", serverConfig.DATABASE_URL.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
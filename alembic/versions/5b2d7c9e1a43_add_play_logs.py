@@ -0,0 +1,41 @@
+"""add play logs
+
+Revision ID: 5b2d7c9e1a43
+Revises: 0e1973f84571
+Create Date: 2026-10-19 10:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2d7c9e1a43'
+down_revision: Union[str, Sequence[str], None] = '0e1973f84571'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('play_logs',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('event_id', sa.String(), nullable=False),
+    sa.Column('client_id', sa.String(), nullable=True),
+    sa.Column('billboard_id', sa.Integer(), nullable=True),
+    sa.Column('ad_id', sa.Integer(), nullable=True),
+    sa.Column('schedule_id', sa.Integer(), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('duration_ms', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('play_logs')
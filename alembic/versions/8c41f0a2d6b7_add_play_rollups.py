@@ -0,0 +1,49 @@
+"""add play rollups
+
+Revision ID: 8c41f0a2d6b7
+Revises: 5b2d7c9e1a43
+Create Date: 2026-10-19 11:03:17.552310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41f0a2d6b7'
+down_revision: Union[str, Sequence[str], None] = '5b2d7c9e1a43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('play_rollups',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('granularity', sa.String(), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('ad_id', sa.Integer(), nullable=False),
+    sa.Column('billboard_id', sa.Integer(), nullable=False),
+    sa.Column('schedule_id', sa.Integer(), nullable=False),
+    sa.Column('plays', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Integer(), nullable=False),
+    sa.Column('total_duration_ms', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('granularity', 'bucket_start', 'ad_id', 'billboard_id', 'schedule_id', name='uq_play_rollups_bucket')
+    )
+    op.create_index('ix_play_rollups_ad_bucket', 'play_rollups', ['granularity', 'ad_id', 'bucket_start'], unique=False)
+    op.create_table('job_watermarks',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('last_id', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('job_watermarks')
+    op.drop_index('ix_play_rollups_ad_bucket', table_name='play_rollups')
+    op.drop_table('play_rollups')
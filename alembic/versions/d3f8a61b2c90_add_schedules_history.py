@@ -0,0 +1,45 @@
+"""add schedules history
+
+Revision ID: d3f8a61b2c90
+Revises: 8c41f0a2d6b7
+Create Date: 2026-10-19 18:02:41.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f8a61b2c90'
+down_revision: Union[str, Sequence[str], None] = '8c41f0a2d6b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schedules_history',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('billboard_id', sa.Integer(), nullable=True),
+    sa.Column('ad_id', sa.Integer(), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.Column('duration', sa.Interval(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_schedules_history_billboard_end', 'schedules_history', ['billboard_id', 'end_time'], unique=False)
+    op.create_index('ix_schedules_history_ad_end', 'schedules_history', ['ad_id', 'end_time'], unique=False)
+    op.create_index(op.f('ix_schedules_start_time'), 'schedules', ['start_time'], unique=False)
+    op.create_index(op.f('ix_schedules_end_time'), 'schedules', ['end_time'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_schedules_end_time'), table_name='schedules')
+    op.drop_index(op.f('ix_schedules_start_time'), table_name='schedules')
+    op.drop_index('ix_schedules_history_ad_end', table_name='schedules_history')
+    op.drop_index('ix_schedules_history_billboard_end', table_name='schedules_history')
+    op.drop_table('schedules_history')
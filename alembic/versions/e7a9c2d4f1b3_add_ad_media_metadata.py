@@ -0,0 +1,42 @@
+"""add ad media metadata
+
+Revision ID: e7a9c2d4f1b3
+Revises: d3f8a61b2c90
+Create Date: 2026-10-19 19:26:05.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a9c2d4f1b3'
+down_revision: Union[str, Sequence[str], None] = 'd3f8a61b2c90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ads', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+    op.add_column('ads', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('ads', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('ads', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('ads', sa.Column('duration_seconds', sa.Float(), nullable=True))
+    op.add_column('ads', sa.Column('video_codec', sa.String(), nullable=True))
+    op.add_column('ads', sa.Column('bitrate', sa.BigInteger(), nullable=True))
+    op.add_column('ads', sa.Column('frame_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ads', 'frame_count')
+    op.drop_column('ads', 'bitrate')
+    op.drop_column('ads', 'video_codec')
+    op.drop_column('ads', 'duration_seconds')
+    op.drop_column('ads', 'height')
+    op.drop_column('ads', 'width')
+    op.drop_column('ads', 'sha256')
+    op.drop_column('ads', 'size_bytes')
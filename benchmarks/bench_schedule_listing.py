@@ -0,0 +1,92 @@
+# Compares the ORM + pydantic schedule listing path with the column-projected
+# fast path on an in-memory SQLite database.
+#
+#   python benchmarks/bench_schedule_listing.py [rows] [repeats]
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from server import models, schemas, service
+from server.responses import FastJSONResponse
+
+scheduleList = TypeAdapter(list[schemas.Schedule])
+
+
+def seed(db, rows):
+    billboards = [models.Billboard(name=f"Billboard {i}", location=f"Zone {i % 7}") for i in range(50)]
+    ads = [models.Ad(file_path=f"https://example.com/ad-{i}.mp4", file_type="video/mp4") for i in range(200)]
+    db.add_all(billboards + ads)
+    db.flush()
+
+    start = datetime(2026, 1, 1)
+    db.add_all(
+        models.Schedule(
+            billboard_id=billboards[i % len(billboards)].id,
+            ad_id=ads[i % len(ads)].id,
+            start_time=start,
+            end_time=start + timedelta(days=30),
+            duration=timedelta(seconds=15),
+        )
+        for i in range(rows)
+    )
+    db.commit()
+
+
+def currentPath(db, rows):
+    # What the route did before: joinedload, response_model validation from
+    # the ORM objects (as FastAPI does), then jsonable_encoder and JSONResponse
+    schedules = service.getSchedules(db, skip=0, limit=rows)
+    validated = scheduleList.validate_python(schedules, from_attributes=True)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fastPath(db, rows):
+    return FastJSONResponse(service.getScheduleListing(db, skip=0, limit=rows)).body
+
+
+def timeit(fn, Session, rows, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        db = Session()
+        try:
+            started = time.perf_counter()
+            body = fn(db, rows)
+            best = min(best, time.perf_counter() - started)
+        finally:
+            db.close()
+    return best, len(body)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = Session()
+    seed(db, rows)
+    db.close()
+
+    current, currentSize = timeit(currentPath, Session, rows, repeats)
+    fast, fastSize = timeit(fastPath, Session, rows, repeats)
+    print(f"rows={rows} best of {repeats}")
+    print(f"current path: {current * 1000:8.1f} ms  ({currentSize} bytes)")
+    print(f"fast path:    {fast * 1000:8.1f} ms  ({fastSize} bytes)")
+    print(f"speedup:      {current / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Startup budget check: imports the API app in fresh interpreters and fails
+# if the median import time exceeds the budget. Run it in CI or before a
+# release to keep worker boot (autoscaling, rolling restarts) fast.
+#
+#   STARTUP_IMPORT_BUDGET_MS=800 python benchmarks/bench_startup.py [runs]
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", 800))
+
+TIMER = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+
+
+def importOnce():
+    # No DATABASE_URL on purpose: importing the app must not need the database
+    env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    result = subprocess.run(
+        [sys.executable, "-c", TIMER], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowestImports(limit=10):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT,
+        capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        # Nested imports are indented further; keep the top-level ones
+        if match and len(match.group(3)) == 1:
+            rows.append((int(match.group(2)), match.group(4)))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    timings = [importOnce() for _ in range(runs)]
+    median = statistics.median(timings)
+
+    print(f"import main: median {median:.1f} ms over {runs} runs (budget {BUDGET_MS:.0f} ms)")
+    print("slowest top-level imports (cumulative us):")
+    for cumulative, name in slowestImports():
+        print(f"  {cumulative:>9}  {name}")
+
+    if median > BUDGET_MS:
+        print("FAIL: import time over budget")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
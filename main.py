@@ -1,13 +1,40 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.encoders import jsonable_encoder
 from fastapi.encoders import jsonable_encoder
-from server import routes, websockets
+from server import database, metrics, notifications, refcache, routes, websockets, playlogs, jobs, rollups, prefetch, sweeper
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup never blocks on the database: the backplane connects in the
+    # background and the schema is managed with `alembic upgrade head`
+    print("Database schema is managed by Alembic: run `alembic upgrade head` before starting workers")
+    backplaneTask = asyncio.create_task(websockets.start_backplane())
+    refcache.start()
+    await playlogs.startWriter()
+    if rollups.ROLLUP_INTERVAL > 0:
+        jobs.startJob("play-rollups", rollups.ROLLUP_INTERVAL, rollups.runRollups)
+    if prefetch.PREFETCH_INTERVAL > 0:
+        jobs.startJob("prefetch-hints", prefetch.PREFETCH_INTERVAL, prefetch.runPrefetch)
+    if sweeper.SWEEP_INTERVAL > 0:
+        jobs.startJob("schedule-sweeper", sweeper.SWEEP_INTERVAL, sweeper.runSweep)
+
+    yield
+
+    await jobs.stopJobs()
+    await notifications.notifier.drain()
+    await playlogs.stopWriter()
+    backplaneTask.cancel()
+    await websockets.stop_backplane()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # WebSocket routes
 app.include_router(websockets.router)
@@ -21,6 +48,8 @@ async def http_exception_handler(request:Request, exc:StarletteHTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content=jsonable_encoder({"detail": exc.detail}),
+        # e.g. Retry-After on 429s from /api/play-events/
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -34,4 +63,28 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 @app.get("/")
 def root():
-    return {"message": "Hello, AdSync is running!"}
\ No newline at end of file
+    return {"message": "Hello, AdSync is running!"}
+
+@app.get("/ready")
+async def ready():
+    # Readiness probe for load balancers / rolling restarts; "/" stays the
+    # liveness check and never touches the database
+    checks = {
+        "database": "ok",
+        "backplane": "ok" if websockets.backplane_ready else "starting",
+    }
+    try:
+        await asyncio.to_thread(database.ping)
+    except Exception as e:
+        checks["database"] = f"unavailable: {e}"
+
+    isReady = all(value == "ok" for value in checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if isReady else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"ready": isReady, "checks": checks},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+def metricsEndpoint():
+    # Prometheus text exposition of this worker's metrics
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,171 @@
+# server/backplane.py
+# Pub/sub backplane used by the WebSocket layer so that a message published on
+# one worker reaches the sockets held by every other worker / node.
+import asyncio
+import json
+import os
+import threading
+import uuid
+
+from . import config, database
+
+PG_CHANNEL = "adsync_ws"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+PG_MAX_PAYLOAD = 7999
+# Size publishers pack envelopes to, leaving room for the "origin" key
+ENVELOPE_BUDGET = PG_MAX_PAYLOAD - 64
+
+
+def payloadSize(envelope: dict) -> int:
+    return len(json.dumps(envelope, separators=(",", ":")).encode())
+
+
+def splitIds(envelope: dict, key: str, ids: list) -> list:
+    # Copies of `envelope` carrying `ids` under `key`, spread over as many
+    # envelopes as needed for each to fit ENVELOPE_BUDGET
+    base = payloadSize({**envelope, key: []})
+    envelopes = []
+    chunk = []
+    size = base
+    for id in ids:
+        idSize = len(json.dumps(id)) + 1
+        if chunk and size + idSize > ENVELOPE_BUDGET:
+            envelopes.append({**envelope, key: chunk})
+            chunk = []
+            size = base
+        chunk.append(id)
+        size += idSize
+    envelopes.append({**envelope, key: chunk})
+    return envelopes
+
+
+class LocalBackplane:
+    # Single process backplane: publishing hands the envelope straight back
+    # to this worker. Used for development and single-worker deployments.
+    def __init__(self):
+        self.handler = None
+
+    async def start(self, handler, onLost=None):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    async def publish(self, envelope: dict):
+        if self.handler:
+            await self.handler(envelope)
+
+
+class PostgresBackplane:
+    # Fans envelopes out through Postgres LISTEN/NOTIFY on the application
+    # database, so no extra service is needed to run several uvicorn workers
+    # or several nodes behind a load balancer.
+    def __init__(self, channel: str = PG_CHANNEL):
+        self.channel = channel
+        self.workerId = uuid.uuid4().hex
+        self.handler = None
+        # Called with the error when the LISTEN connection dies
+        self.onLost = None
+        self.loop = None
+        self.listenConn = None
+        # Kept apart: fileno() fails once the connection is closed
+        self.listenFd = None
+        self.publishConn = None
+        self.publishLock = threading.Lock()
+
+    def _connect(self):
+        # Borrow the DSN/driver settings from the SQLAlchemy engine but keep
+        # the connection out of the pool, it lives as long as the worker.
+        fairy = database.getEngine().raw_connection()
+        fairy.detach()
+        conn = fairy.dbapi_connection
+        conn.autocommit = True
+        return conn
+
+    async def start(self, handler, onLost=None):
+        # Drop what is left of a previous, lost connection
+        await self.stop()
+        self.handler = handler
+        self.onLost = onLost
+        self.loop = asyncio.get_running_loop()
+        self.listenConn = await asyncio.to_thread(self._connect)
+        self.publishConn = await asyncio.to_thread(self._connect)
+
+        with self.listenConn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        self.listenFd = self.listenConn.fileno()
+        self.loop.add_reader(self.listenFd, self._onNotify)
+        print(f"Postgres backplane listening on '{self.channel}' (worker {self.workerId})")
+
+    async def stop(self):
+        self._closeListen()
+        if self.publishConn is not None:
+            self.publishConn.close()
+            self.publishConn = None
+
+    def _closeListen(self):
+        if self.listenFd is not None:
+            self.loop.remove_reader(self.listenFd)
+            self.listenFd = None
+        if self.listenConn is not None:
+            self.listenConn.close()
+            self.listenConn = None
+
+    def _onNotify(self):
+        try:
+            self.listenConn.poll()
+        except Exception as e:
+            # Postgres restarted or failed over: the fd stays readable at EOF,
+            # so stop watching it before anything else
+            self._closeListen()
+            print(f"Backplane LISTEN connection lost: {e}")
+            if self.onLost is not None:
+                self.onLost(e)
+            return
+        while self.listenConn.notifies:
+            notify = self.listenConn.notifies.pop(0)
+            try:
+                envelope = json.loads(notify.payload)
+            except ValueError as e:
+                print(f"Backplane dropped malformed payload: {e}")
+                continue
+
+            # Our own publishes were already delivered locally
+            if envelope.get("origin") == self.workerId:
+                continue
+            self.loop.create_task(self.handler(envelope))
+
+    def _notify(self, payload: str):
+        with self.publishLock:
+            try:
+                with self.publishConn.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+            except Exception:
+                # Connection dropped (failover, idle timeout): reconnect once
+                self.publishConn = self._connect()
+                with self.publishConn.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+
+    async def publish(self, envelope: dict):
+        envelope = {**envelope, "origin": self.workerId}
+        payload = json.dumps(envelope, separators=(",", ":"))
+        if len(payload.encode()) > PG_MAX_PAYLOAD:
+            raise ValueError(f"Backplane payload too large ({len(payload)} bytes)")
+
+        # Local sockets get the message without waiting on the round-trip
+        if self.handler:
+            await self.handler(envelope)
+        if self.publishConn is None:
+            # Not started yet (database down at boot): other workers can't be
+            # reached, start_backplane is still retrying
+            return
+        await asyncio.to_thread(self._notify, payload)
+
+
+def createBackplane():
+    kind = os.getenv("WS_BACKPLANE", "local").lower()
+    if kind == "postgres":
+        return PostgresBackplane(channel=os.getenv("WS_BACKPLANE_CHANNEL", PG_CHANNEL))
+    if kind != "local":
+        print(f"Unknown WS_BACKPLANE '{kind}', falling back to local")
+    return LocalBackplane()
@@ -0,0 +1,143 @@
+# server/cachecontrol.py
+# Remote media cache commands (purge, invalidate, prefetch) for a set of
+# billboards. The issuing worker publishes the command on the backplane,
+# every worker hands it to its matching sockets and reports how many it
+# reached, and players acknowledge over their WebSocket. Acks are published
+# on the backplane too and collected by the issuing worker until every
+# player reached has answered or the timeout expires.
+import asyncio
+import os
+import time
+import uuid
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from . import backplane, models, schemas, websockets
+
+CACHE_COMMAND_TIMEOUT = float(os.getenv("CACHE_COMMAND_TIMEOUT", 10))
+CACHE_COMMAND_MAX_TIMEOUT = float(os.getenv("CACHE_COMMAND_MAX_TIMEOUT", 60))
+# Dispatch reports from other workers arrive shortly after the command; an
+# early finish waits at least this long so none is missed
+DISPATCH_SETTLE_SECONDS = 0.5
+
+
+class PendingCommand:
+    def __init__(self, billboardIds: list):
+        self.billboardIds = billboardIds
+        self.dispatched = 0
+        self.acks = []
+        self.changed = asyncio.Event()
+
+    def isComplete(self) -> bool:
+        # Every player the command reached has answered; billboards with no
+        # player online never will and are reported as missing instead
+        return len(self.acks) >= self.dispatched
+
+
+# command id -> PendingCommand, for commands issued by this worker
+pending: dict[str, PendingCommand] = {}
+
+
+def resolveBillboards(db: Session, billboardIds: list = None, location: str = None) -> list:
+    query = db.query(models.Billboard.id)
+    if billboardIds:
+        query = query.filter(models.Billboard.id.in_(billboardIds))
+    if location:
+        query = query.filter(models.Billboard.location == location)
+    return [row.id for row in query.order_by(models.Billboard.id)]
+
+
+async def runCommand(db: Session, command: schemas.CacheCommandCreate):
+    if not command.billboard_ids and not command.location:
+        raise HTTPException(status_code=400, detail="billboard_ids or location is required")
+    if command.action in ("invalidate", "prefetch") and not command.urls:
+        raise HTTPException(status_code=400, detail=f"{command.action} requires urls")
+
+    billboardIds = resolveBillboards(db, command.billboard_ids, command.location)
+    if not billboardIds:
+        raise HTTPException(status_code=404, detail="No matching billboards")
+
+    timeout = min(command.timeout or CACHE_COMMAND_TIMEOUT, CACHE_COMMAND_MAX_TIMEOUT)
+    commandId = uuid.uuid4().hex
+    message = {
+        "type": "cache_command",
+        "command_id": commandId,
+        "action": command.action,
+        "urls": command.urls,
+        # Players bound their own work (prefetch downloads) by the same timeout
+        "timeout": timeout,
+    }
+
+    entry = PendingCommand(billboardIds)
+    pending[commandId] = entry
+    try:
+        try:
+            # Fleet-wide commands target more billboards than one NOTIFY
+            # payload holds; every chunk's dispatch report adds up
+            for envelope in backplane.splitIds({"kind": "cache_command", "message": message}, "billboard_ids", billboardIds):
+                await websockets.bus.publish(envelope)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+        startedAt = time.monotonic()
+        deadline = startedAt + timeout
+        while True:
+            settled = time.monotonic() - startedAt >= DISPATCH_SETTLE_SECONDS
+            if settled and entry.isComplete():
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            entry.changed.clear()
+            try:
+                await asyncio.wait_for(entry.changed.wait(), min(remaining, DISPATCH_SETTLE_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        pending.pop(commandId, None)
+
+    acked = {ack.get("billboard_id") for ack in entry.acks}
+    return {
+        "command_id": commandId,
+        "action": command.action,
+        "billboard_ids": billboardIds,
+        "dispatched": entry.dispatched,
+        "acks": entry.acks,
+        "missing": [billboardId for billboardId in billboardIds if billboardId not in acked],
+        "freed_bytes": sum(ack.get("freed_bytes") or 0 for ack in entry.acks),
+        "timed_out": not entry.isComplete(),
+    }
+
+
+async def onCommand(envelope: dict):
+    # Every worker: forward to the local players of the targeted billboards
+    sent = await websockets.deliver_to_billboards(envelope["billboard_ids"], envelope["message"])
+    if sent:
+        await websockets.bus.publish({
+            "kind": "cache_dispatched",
+            "command_id": envelope["message"]["command_id"],
+            "count": sent,
+        })
+
+
+async def onDispatched(envelope: dict):
+    entry = pending.get(envelope["command_id"])
+    if entry is not None:
+        entry.dispatched += envelope["count"]
+        entry.changed.set()
+
+
+async def onAck(envelope: dict):
+    ack = envelope["ack"]
+    entry = pending.get(ack.get("command_id"))
+    if entry is not None:
+        entry.acks.append(ack)
+        entry.changed.set()
+
+
+websockets.envelope_handlers.update({
+    "cache_command": onCommand,
+    "cache_dispatched": onDispatched,
+    "cache_ack": onAck,
+})
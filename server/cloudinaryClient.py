@@ -1,18 +1,23 @@
-import cloudinary
-from cloudinary import CloudinaryImage
-from cloudinary.uploader import upload
-import cloudinary.api
-import os
-from dotenv import load_dotenv
 from fastapi import HTTPException, status, UploadFile
-load_dotenv()
+from . import config
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET"),
-    secure=True
-    )
+# The SDK is imported and configured on the first upload, not at import time
+uploader = None
+
+def getUploader():
+    global uploader
+    if uploader is None:
+        import cloudinary
+        import cloudinary.uploader
+
+        cloudinary.config(
+            cloud_name=config.CLOUDINARY_NAME,
+            api_key=config.CLOUDINARY_API_KEY,
+            api_secret=config.CLOUDINARY_API_SECRET,
+            secure=True
+            )
+        uploader = cloudinary.uploader
+    return uploader
 
 # def uploadFileToloudinary(uploaded:UploadFile):
 #     print(f"Uploading {uploaded} to Cloudinary...")
@@ -33,7 +38,7 @@ def uploadFileToloudinary(uploaded:UploadFile):
             resourceType = "raw"
 
         print(f"Uploading {resourceType} to Cloudinary...")
-        result = upload(
+        result = getUploader().upload(
             uploaded.file, 
             resource_type=resourceType, 
             asset_folder="adsync"
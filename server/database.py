@@ -1,11 +1,32 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, declarative_base
-import os
-from dotenv import load_dotenv
+import threading
+from . import config, metrics
 
-load_dotenv()
-
-engine = create_engine(os.getenv("DATABASE_URL"))
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The engine is created on first use rather than at import time, so workers
+# boot without touching the database and without DATABASE_URL being needed
+# by tools that only want the models (Alembic, benchmarks).
+engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+engineLock = threading.Lock()
 
 Base = declarative_base()
+
+def getEngine():
+    global engine
+    if engine is None:
+        with engineLock:
+            if engine is None:
+                engine = create_engine(config.DATABASE_URL, pool_pre_ping=True)
+                metrics.instrumentEngine(engine)
+                SessionLocal.configure(bind=engine)
+    return engine
+
+def getSession():
+    getEngine()
+    return SessionLocal()
+
+def ping():
+    # Cheap readiness probe
+    with getEngine().connect() as connection:
+        connection.execute(text("SELECT 1"))
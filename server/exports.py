@@ -0,0 +1,61 @@
+# server/exports.py
+# Streaming NDJSON exports of schedules and ads for admin exports and bulk
+# syncs. Rows are read through a server-side cursor EXPORT_BATCH_ROWS at a
+# time and encoded batch by batch, so worker memory stays flat whatever the
+# result size and the first lines go out as soon as the first batch is read.
+import json
+import os
+
+from . import database, models, service
+from .responses import orjson
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 1000))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encodeLine(row: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(row) + b"\n"
+    return json.dumps(row, separators=(",", ":")).encode() + b"\n"
+
+
+def adRow(row):
+    # JSON-safe dict in the schemas.Ad shape
+    ad = dict(row._mapping)
+    ad["uploaded_at"] = ad["uploaded_at"].isoformat() if ad["uploaded_at"] is not None else None
+    return ad
+
+
+def streamRows(buildQuery, toDict):
+    # Sync generator, StreamingResponse runs it in the threadpool. It opens
+    # its own session: the request's one may close before streaming ends.
+    # One chunk per batch keeps the per-chunk threadpool hop off the row path
+    db = database.getSession()
+    try:
+        chunk = []
+        for row in buildQuery(db).yield_per(EXPORT_BATCH_ROWS):
+            chunk.append(encodeLine(toDict(row)))
+            if len(chunk) >= EXPORT_BATCH_ROWS:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
+    finally:
+        db.close()
+
+
+def streamSchedules(billboardId: int = None):
+    def buildQuery(db):
+        query = service.scheduleListingQuery(db)
+        if billboardId is not None:
+            query = query.filter(models.Schedule.billboard_id == billboardId)
+        return query
+
+    return streamRows(buildQuery, service.scheduleListingRow)
+
+
+def streamAds():
+    def buildQuery(db):
+        return db.query(*models.Ad.__table__.columns).order_by(models.Ad.id)
+
+    return streamRows(buildQuery, adRow)
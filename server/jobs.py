@@ -0,0 +1,31 @@
+# server/jobs.py
+# Minimal periodic background job runner. Jobs are plain blocking functions
+# run in a worker thread so they never stall the event loop; coroutine
+# functions are awaited on the loop instead.
+import asyncio
+
+tasks: list[asyncio.Task] = []
+
+
+async def runPeriodically(name: str, intervalSeconds: float, fn):
+    while True:
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                await fn()
+            else:
+                await asyncio.to_thread(fn)
+        except Exception as e:
+            print(f"Background job '{name}' failed: {e}")
+        await asyncio.sleep(intervalSeconds)
+
+
+def startJob(name: str, intervalSeconds: float, fn):
+    print(f"Starting background job '{name}' every {intervalSeconds}s")
+    tasks.append(asyncio.create_task(runPeriodically(name, intervalSeconds, fn)))
+
+
+async def stopJobs():
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tasks.clear()
@@ -0,0 +1,125 @@
+# server/mediaprobe.py
+# Local probing of uploaded media before it goes to Cloudinary: size and
+# sha256 always, image dimensions and GIF frame counts with Pillow, video
+# duration/codec/bitrate with ffprobe. Both tools are optional; whatever
+# can't be determined is left as None.
+import hashlib
+import json
+import shutil
+import subprocess
+import tempfile
+
+# Pillow is optional, without it only GIF/PNG dimensions are read from the header
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FFPROBE_TIMEOUT = 30
+CHUNK_BYTES = 1024 * 1024
+
+
+def emptyMetadata():
+    return {
+        "size_bytes": None,
+        "sha256": None,
+        "width": None,
+        "height": None,
+        "duration_seconds": None,
+        "video_codec": None,
+        "bitrate": None,
+        "frame_count": None,
+    }
+
+
+def hashFile(fileobj):
+    # (size, sha256) of the whole stream, left rewound
+    sha256 = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_BYTES), b""):
+        sha256.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return size, sha256.hexdigest()
+
+
+def headerDimensions(header: bytes):
+    # GIF logical screen and PNG IHDR sizes, for when Pillow is missing
+    if header[:6] in (b"GIF87a", b"GIF89a") and len(header) >= 10:
+        return int.from_bytes(header[6:8], "little"), int.from_bytes(header[8:10], "little")
+    if header[:8] == b"\x89PNG\r\n\x1a\n" and len(header) >= 24:
+        return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+    return None, None
+
+
+def probeImage(fileobj, metadata: dict):
+    if Image is None:
+        metadata["width"], metadata["height"] = headerDimensions(fileobj.read(32))
+        fileobj.seek(0)
+        return
+
+    with Image.open(fileobj) as image:
+        metadata["width"], metadata["height"] = image.size
+        frameCount = getattr(image, "n_frames", 1)
+        if frameCount > 1:
+            # Animated: one loop's length, from the per-frame delays
+            metadata["frame_count"] = frameCount
+            totalMs = 0
+            for index in range(frameCount):
+                image.seek(index)
+                totalMs += image.info.get("duration", 0)
+            metadata["duration_seconds"] = totalMs / 1000 if totalMs else None
+        else:
+            metadata["frame_count"] = 1
+    fileobj.seek(0)
+
+
+def probeVideo(fileobj, metadata: dict):
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return
+
+    # ffprobe needs a seekable file (MP4 indexes may sit at the end)
+    with tempfile.NamedTemporaryFile() as tmp:
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, tmp, CHUNK_BYTES)
+        tmp.flush()
+        fileobj.seek(0)
+        result = subprocess.run(
+            [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", tmp.name],
+            capture_output=True, timeout=FFPROBE_TIMEOUT, check=True,
+        )
+
+    info = json.loads(result.stdout)
+    fmt = info.get("format", {})
+    video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), {})
+
+    duration = fmt.get("duration") or video.get("duration")
+    bitrate = fmt.get("bit_rate") or video.get("bit_rate")
+    frames = video.get("nb_frames")
+    metadata.update({
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "duration_seconds": float(duration) if duration else None,
+        "video_codec": video.get("codec_name"),
+        "bitrate": int(bitrate) if bitrate else None,
+        "frame_count": int(frames) if frames and str(frames).isdigit() else None,
+    })
+
+
+def probeMedia(fileobj, contentType: str) -> dict:
+    # Blocking: reads the whole upload and may run ffprobe
+    metadata = emptyMetadata()
+    metadata["size_bytes"], metadata["sha256"] = hashFile(fileobj)
+
+    try:
+        if contentType.startswith("image"):
+            probeImage(fileobj, metadata)
+        elif contentType.startswith("video"):
+            probeVideo(fileobj, metadata)
+    except Exception as e:
+        # Metadata is best effort, the upload goes ahead without it
+        print(f"Media probe failed ({contentType}): {e}")
+        fileobj.seek(0)
+    return metadata
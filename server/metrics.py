@@ -0,0 +1,230 @@
+# server/metrics.py
+# In-process metrics in the Prometheus text format: per-route request
+# latency, per-request SQL query counts and time (from SQLAlchemy engine
+# events), and WebSocket delivery timings. Each worker keeps its own
+# numbers; scrape the workers individually. An opt-in sampler prints the
+# stacks of requests that run longer than SLOW_REQUEST_SECONDS.
+import contextvars
+import os
+import sys
+import threading
+import time
+import traceback
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+# 0 disables the slow request sampler
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 0))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelNames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted(self.series.items())
+        for labels, series in items:
+            base = formatLabels(self.labelNames, labels)
+            for bound, count in zip(self.buckets, series):
+                bucketLabels = joinLabels(base, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{{{bucketLabels}}} {count}")
+            infLabels = joinLabels(base, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{{{infLabels}}} {series[-1]}")
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelNames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.series.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{{{formatLabels(self.labelNames, labels)}}} {value}")
+        return lines
+
+
+class Gauge:
+    # Sampled at render time from a callback
+    def __init__(self, name: str, help: str, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.fn()}"]
+
+
+def formatLabels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{escapeLabel(value)}"' for name, value in zip(names, values))
+
+
+def joinLabels(*parts) -> str:
+    return ",".join(part for part in parts if part)
+
+
+def escapeLabel(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+requestLatency = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+requestQueries = Histogram("http_request_sql_queries", "SQL statements executed per HTTP request", ("method", "route"), QUERY_COUNT_BUCKETS)
+requestSqlTime = Histogram("http_request_sql_seconds", "Time spent in SQL per HTTP request", ("method", "route"))
+queryLatency = Histogram("db_query_duration_seconds", "SQL statement latency", ("statement",))
+wsDeliveryLatency = Histogram("ws_delivery_seconds", "Time to deliver a WebSocket message to this worker's sockets", ("target",))
+wsFramesSent = Counter("ws_frames_sent_total", "WebSocket frames sent", ("target",))
+slowRequests = Counter("http_slow_requests_total", "Requests over SLOW_REQUEST_SECONDS", ("method", "route"))
+
+registry = [requestLatency, requestQueries, requestSqlTime, queryLatency, wsDeliveryLatency, wsFramesSent, slowRequests]
+
+
+def registerGauge(name: str, help: str, fn):
+    registry.append(Gauge(name, help, fn))
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------- Per-request SQL accounting --------
+class RequestStats:
+    # Mutable, so queries run in threadpool copies of the context still add
+    # to the request's totals
+    def __init__(self):
+        self.queries = 0
+        self.sqlSeconds = 0.0
+        self.threads = set()
+
+
+currentRequest: contextvars.ContextVar = contextvars.ContextVar("currentRequest", default=None)
+
+
+def beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    # On the statement's execution context rather than the connection: a
+    # statement that raises never reaches afterCursorExecute, and a start
+    # kept on the pooled connection would pair with the next statement
+    if context is not None:
+        context.metricsQueryStart = time.perf_counter()
+
+
+def afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    startedAt = getattr(context, "metricsQueryStart", None)
+    if startedAt is None:
+        return
+    elapsed = time.perf_counter() - startedAt
+    queryLatency.observe(elapsed, statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "")
+    stats = currentRequest.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.sqlSeconds += elapsed
+        stats.threads.add(threading.get_ident())
+
+
+def instrumentEngine(engine):
+    if not METRICS_ENABLED:
+        return
+    event.listen(engine, "before_cursor_execute", beforeCursorExecute)
+    event.listen(engine, "after_cursor_execute", afterCursorExecute)
+
+
+# -------- Slow request sampler --------
+def routeLabel(scope) -> str:
+    # Route template rather than the raw path, to keep label cardinality bounded
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+def sampleSlowRequest(scope, stats: RequestStats, loopThread: int, startedAt: float):
+    # Runs on a timer thread, so it also sees a blocked event loop
+    frames = sys._current_frames()
+    elapsed = time.perf_counter() - startedAt
+    method, route = scope["method"], routeLabel(scope)
+    slowRequests.inc(1, method, route)
+    report = [f"Slow request {method} {route}: {elapsed:.2f}s, {stats.queries} queries ({stats.sqlSeconds:.2f}s SQL)"]
+    for threadId in [loopThread] + sorted(stats.threads - {loopThread}):
+        frame = frames.get(threadId)
+        if frame is None:
+            continue
+        label = "event loop" if threadId == loopThread else f"thread {threadId}"
+        report.append(f"--- {label} ---")
+        report.extend(line.rstrip() for line in traceback.format_stack(frame))
+    print("\n".join(report))
+
+
+# -------- ASGI middleware --------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = currentRequest.set(stats)
+        method = scope["method"]
+        statusCode = 500
+        startedAt = time.perf_counter()
+
+        sampler = None
+        if SLOW_REQUEST_SECONDS > 0:
+            sampler = threading.Timer(
+                SLOW_REQUEST_SECONDS, sampleSlowRequest,
+                (scope, stats, threading.get_ident(), startedAt))
+            sampler.daemon = True
+            sampler.start()
+
+        async def sendWrapper(message):
+            nonlocal statusCode
+            if message["type"] == "http.response.start":
+                statusCode = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, sendWrapper)
+        finally:
+            elapsed = time.perf_counter() - startedAt
+            if sampler is not None:
+                sampler.cancel()
+            currentRequest.reset(token)
+            routePath = routeLabel(scope)
+            requestLatency.observe(elapsed, method, routePath, statusCode)
+            requestQueries.observe(stats.queries, method, routePath)
+            requestSqlTime.observe(stats.sqlSeconds, method, routePath)
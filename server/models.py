@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Interval
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Float, ForeignKey, Interval, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -21,6 +21,16 @@ class Ad(Base):
     file_type = Column(String, nullable=False) 
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Probed at upload (mediaprobe); null when unknown, e.g. older ads
+    size_bytes = Column(BigInteger, nullable=True)
+    sha256 = Column(String(64), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    video_codec = Column(String, nullable=True)
+    bitrate = Column(BigInteger, nullable=True)
+    frame_count = Column(Integer, nullable=True)
+
     schedules = relationship("Schedule", back_populates="ad")
 
 
@@ -30,9 +40,74 @@ class Schedule(Base):
     id = Column(Integer, primary_key=True, index=True)
     billboard_id = Column(Integer, ForeignKey("billboards.id"))
     ad_id = Column(Integer, ForeignKey("ads.id"))
-    start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime, nullable=False)
+    start_time = Column(DateTime, nullable=False, index=True)
+    end_time = Column(DateTime, nullable=False, index=True)
     duration = Column(Interval, nullable=True) 
 
     billboard = relationship("Billboard", back_populates="schedules")
-    ad = relationship("Ad", back_populates="schedules")
\ No newline at end of file
+    ad = relationship("Ad", back_populates="schedules")
+
+
+class ScheduleHistory(Base):
+    __tablename__ = "schedules_history"
+    __table_args__ = (
+        Index("ix_schedules_history_billboard_end", "billboard_id", "end_time"),
+        Index("ix_schedules_history_ad_end", "ad_id", "end_time"),
+    )
+
+    # Expired schedules moved out of the hot table by the sweeper, keeping
+    # their original ids. No foreign keys, like play_logs, so archived rows
+    # outlive the ads and billboards they reference
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    billboard_id = Column(Integer, nullable=True)
+    ad_id = Column(Integer, nullable=True)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    duration = Column(Interval, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class PlayLog(Base):
+    __tablename__ = "play_logs"
+
+    # Append-only proof-of-play log. No foreign keys on purpose: it is written
+    # at fleet rate and must keep rows for ads/schedules that are later removed
+    id = Column(BigInteger, primary_key=True)
+    event_id = Column(String, nullable=False, unique=True)
+    client_id = Column(String, nullable=True)
+    billboard_id = Column(Integer, nullable=True)
+    ad_id = Column(Integer, nullable=True)
+    schedule_id = Column(Integer, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class PlayRollup(Base):
+    __tablename__ = "play_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "ad_id", "billboard_id", "schedule_id", name="uq_play_rollups_bucket"),
+        Index("ix_play_rollups_ad_bucket", "granularity", "ad_id", "bucket_start"),
+    )
+
+    # Pre-aggregated play_logs. Unknown ids are stored as 0 so the unique
+    # constraint (and the incremental upsert) also matches those buckets
+    id = Column(BigInteger, primary_key=True)
+    granularity = Column(String, nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    ad_id = Column(Integer, nullable=False, default=0)
+    billboard_id = Column(Integer, nullable=False, default=0)
+    schedule_id = Column(Integer, nullable=False, default=0)
+    plays = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    total_duration_ms = Column(BigInteger, nullable=False, default=0)
+
+
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+
+    # Last source row processed by an incremental background job
+    name = Column(String, primary_key=True)
+    last_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
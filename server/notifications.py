@@ -0,0 +1,115 @@
+# server/notifications.py
+# Coalesces schedule change notifications. Writes are collected per billboard
+# until no new one arrived for NOTIFY_DEBOUNCE_MS, or NOTIFY_MAX_LATENCY_MS
+# after the first, then every player receives a single "schedules_changed"
+# message for the burst instead of one per write.
+import asyncio
+import os
+import time
+
+from . import backplane, websockets
+
+NOTIFY_DEBOUNCE_MS = float(os.getenv("NOTIFY_DEBOUNCE_MS", 200))
+NOTIFY_MAX_LATENCY_MS = float(os.getenv("NOTIFY_MAX_LATENCY_MS", 1000))
+# Ids listed per message; beyond that only the count is sent, players
+# refetch the listing either way and NOTIFY payloads are capped at 8 kB
+MAX_IDS_PER_MESSAGE = 100
+
+
+def changeMessage(schedules: list, billboardIds: list):
+    return {
+        "type": "schedules_changed",
+        "billboard_ids": billboardIds[:MAX_IDS_PER_MESSAGE],
+        "schedule_ids": [schedule["id"] for schedule in schedules[:MAX_IDS_PER_MESSAGE]],
+        "count": len(schedules),
+    }
+
+
+class ScheduleNotifier:
+    def __init__(self, debounceMs: float = NOTIFY_DEBOUNCE_MS, maxLatencyMs: float = NOTIFY_MAX_LATENCY_MS):
+        self.debounce = debounceMs / 1000
+        self.maxLatency = maxLatencyMs / 1000
+        self.pending = {}  # billboard_id -> [schedule message]
+        self.firstAt = None
+        self.lastAt = None
+        self.task = None
+        # Flushes already publishing; drain waits for them instead of
+        # cancelling them with the timer
+        self.flushing = set()
+
+    def add(self, schedule: dict):
+        self.pending.setdefault(schedule["billboard_id"], []).append(schedule)
+        now = time.monotonic()
+        if self.firstAt is None:
+            self.firstAt = now
+        self.lastAt = now
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        # Changes added while a flush is being published start the next window
+        while self.pending:
+            flushAt = min(self.lastAt + self.debounce, self.firstAt + self.maxLatency)
+            delay = flushAt - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            await asyncio.shield(self.startFlush())
+
+    def startFlush(self):
+        task = asyncio.create_task(self.flush())
+        self.flushing.add(task)
+        task.add_done_callback(self.flushing.discard)
+        return task
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        self.firstAt = self.lastAt = None
+        if not pending:
+            return
+
+        everything = [schedule for schedules in pending.values() for schedule in schedules]
+        for envelope in groupedEnvelopes(pending, changeMessage(everything, list(pending))):
+            try:
+                await websockets.bus.publish(envelope)
+            except Exception as e:
+                print(f"Schedule change notification failed: {e}")
+
+    async def drain(self):
+        # Shutdown: stop the debounce timer, let batches already publishing
+        # finish, then send what is still pending right away
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.flushing:
+            await asyncio.gather(*self.flushing, return_exceptions=True)
+        await self.flush()
+
+
+def groupedEnvelopes(pending: dict, allMessage: dict) -> list:
+    # "grouped" envelopes with one message per billboard, split so each fits
+    # the backplane payload limit; the first also carries the combined
+    # message for unbound sockets
+    envelopes = []
+    envelope = {"kind": "grouped", "by_billboard": {}, "all": allMessage}
+    size = backplane.payloadSize(envelope)
+    for billboardId, schedules in pending.items():
+        # JSON object keys, the envelope may cross the backplane
+        key = str(billboardId)
+        message = changeMessage(schedules, [billboardId])
+        entrySize = backplane.payloadSize({key: message})
+        if envelope["by_billboard"] and size + entrySize > backplane.ENVELOPE_BUDGET:
+            envelopes.append(envelope)
+            envelope = {"kind": "grouped", "by_billboard": {}}
+            size = backplane.payloadSize(envelope)
+        envelope["by_billboard"][key] = message
+        size += entrySize
+    envelopes.append(envelope)
+    return envelopes
+
+
+notifier = ScheduleNotifier()
+
+
+def scheduleChanged(schedule: dict):
+    notifier.add(schedule)
@@ -0,0 +1,124 @@
+# server/playlogs.py
+# Proof-of-play ingestion. Requests hand their events to a per-worker writer
+# task that coalesces them into bulk inserts on its own sessions, so a burst
+# of uploads from the fleet never competes with the scheduling endpoints.
+import asyncio
+import os
+
+from sqlalchemy.dialects.postgresql import insert
+
+from . import config, database, models, schemas
+
+MAX_BATCH_ROWS = int(os.getenv("PLAYLOG_MAX_BATCH_ROWS", 2000))
+FLUSH_INTERVAL = float(os.getenv("PLAYLOG_FLUSH_INTERVAL", 0.25))
+# Above this many rows waiting to be written new uploads are pushed back
+MAX_PENDING_ROWS = int(os.getenv("PLAYLOG_MAX_PENDING_ROWS", 50000))
+RETRY_AFTER_SECONDS = int(os.getenv("PLAYLOG_RETRY_AFTER", 5))
+
+queue: asyncio.Queue = None
+writerTask: asyncio.Task = None
+pendingRows = 0
+
+
+class IngestOverloaded(Exception):
+    def __init__(self, retryAfter: int):
+        super().__init__(f"Play event ingestion overloaded, retry after {retryAfter}s")
+        self.retryAfter = retryAfter
+
+
+async def startWriter():
+    global queue, writerTask
+    queue = asyncio.Queue()
+    writerTask = asyncio.create_task(writerLoop())
+
+async def stopWriter():
+    global writerTask
+    if writerTask is None:
+        return
+    # Let queued submissions reach the database before shutting down
+    await queue.join()
+    writerTask.cancel()
+    writerTask = None
+
+
+async def ingest(client_id: str, events: list[schemas.PlayEventCreate]) -> list[str]:
+    # Resolves once the events are committed, so the caller only drops its
+    # local copy after they are durable. Duplicates are ignored by event_id.
+    global pendingRows
+    if not events:
+        return []
+    if queue is None or pendingRows + len(events) > MAX_PENDING_ROWS:
+        raise IngestOverloaded(RETRY_AFTER_SECONDS)
+
+    rows = [{**event.dict(), "client_id": client_id} for event in events]
+    done = asyncio.get_running_loop().create_future()
+    pendingRows += len(rows)
+    queue.put_nowait((rows, done))
+    await done
+    return [row["event_id"] for row in rows]
+
+
+async def writerLoop():
+    global pendingRows
+    loop = asyncio.get_running_loop()
+    while True:
+        submissions = [await queue.get()]
+        rowCount = len(submissions[0][0])
+        deadline = loop.time() + FLUSH_INTERVAL
+
+        # Gather more submissions until the batch is full or the window ends
+        while rowCount < MAX_BATCH_ROWS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                submission = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            submissions.append(submission)
+            rowCount += len(submission[0])
+
+        rows = [row for submissionRows, _ in submissions for row in submissionRows]
+        try:
+            await asyncio.to_thread(writeBatch, rows)
+            errors = [None] * len(submissions)
+        except Exception as e:
+            print(f"Play log batch of {len(rows)} rows failed: {e}")
+            # One bad submission must not fail the clients coalesced with
+            # it: write each on its own so only the culprit gets the error
+            errors = await retrySeparately(submissions) if len(submissions) > 1 else [e]
+
+        pendingRows -= rowCount
+        for (_, done), error in zip(submissions, errors):
+            if not done.done():
+                if error:
+                    done.set_exception(error)
+                else:
+                    done.set_result(None)
+            queue.task_done()
+
+
+async def retrySeparately(submissions: list) -> list:
+    errors = []
+    for submissionRows, _ in submissions:
+        try:
+            await asyncio.to_thread(writeBatch, submissionRows)
+            errors.append(None)
+        except Exception as e:
+            print(f"Play log submission of {len(submissionRows)} rows failed: {e}")
+            errors.append(e)
+    return errors
+
+
+def writeBatch(rows: list[dict]):
+    db = database.getSession()
+    try:
+        stmt = (
+            insert(models.PlayLog)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["event_id"])
+        )
+        db.execute(stmt)
+        db.commit()
+    finally:
+        db.close()
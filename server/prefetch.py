@@ -0,0 +1,60 @@
+# server/prefetch.py
+# Pre-staging of media ahead of schedule start. Periodically scans schedules
+# starting within the lead time and hints their media to the players, which
+# download it in the background so campaigns are cached before going live.
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from . import database, models, websockets
+
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", 60))
+PREFETCH_LEAD_SECONDS = float(os.getenv("PREFETCH_LEAD_SECONDS", 24 * 3600))
+
+
+def getUpcomingAssets(db: Session, now: datetime, until: datetime):
+    # {billboard_id: [asset hint]} for schedules starting in (now, until]
+    rows = (
+        db.query(
+            models.Schedule.id,
+            models.Schedule.billboard_id,
+            models.Schedule.start_time,
+            models.Ad.file_path,
+            models.Ad.file_type,
+            models.Ad.size_bytes,
+            models.Ad.sha256,
+        )
+        .join(models.Ad, models.Schedule.ad_id == models.Ad.id)
+        .filter(models.Schedule.start_time > now, models.Schedule.start_time <= until)
+        .order_by(models.Schedule.start_time)
+    )
+    assets = {}
+    for row in rows:
+        assets.setdefault(row.billboard_id, []).append({
+            "schedule_id": row.id,
+            "url": row.file_path,
+            "file_type": row.file_type,
+            "size_bytes": row.size_bytes,
+            "sha256": row.sha256,
+            "start_time": row.start_time.isoformat(),
+        })
+    return assets
+
+
+def loadUpcomingAssets():
+    # Schedule times are stored as naive UTC
+    now = datetime.utcnow()
+    db = database.getSession()
+    try:
+        return getUpcomingAssets(db, now, now + timedelta(seconds=PREFETCH_LEAD_SECONDS))
+    finally:
+        db.close()
+
+
+async def runPrefetch():
+    if not websockets.active_connections:
+        return
+    assets = await asyncio.to_thread(loadUpcomingAssets)
+    await websockets.send_prefetch_hints(assets)
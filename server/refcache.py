@@ -0,0 +1,139 @@
+# server/refcache.py
+# In-process cache of ad and billboard rows, which change rarely but are
+# read on every schedule write. Entries are plain dicts keyed by id, bounded
+# by REFCACHE_MAX_ENTRIES (least recently used go first) and expire after
+# REFCACHE_TTL_SECONDS. Committed updates and deletes of either model evict
+# the entry on this worker and, through the backplane, on every other one;
+# the TTL bounds staleness for writes made outside the app.
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import database, metrics, models, websockets
+
+# 0 disables caching, every lookup goes to the database
+REFCACHE_TTL_SECONDS = float(os.getenv("REFCACHE_TTL_SECONDS", 300))
+REFCACHE_MAX_ENTRIES = int(os.getenv("REFCACHE_MAX_ENTRIES", 10000))
+
+lookups = metrics.Counter("refcache_lookups_total", "Reference cache lookups", ("table", "result"))
+metrics.registry.append(lookups)
+
+
+class RefCache:
+    def __init__(self, model, ttl: float = REFCACHE_TTL_SECONDS, maxEntries: int = REFCACHE_MAX_ENTRIES):
+        self.model = model
+        self.table = model.__tablename__
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()  # id -> (expiresAt, row dict)
+        # Bumped by every invalidation, so a row loaded while one happened
+        # isn't stored over it
+        self.generation = 0
+        # Sync routes run in the threadpool
+        self.lock = threading.Lock()
+
+    def get(self, db: Session, id: int):
+        # Row as a dict, or None when it doesn't exist (misses aren't cached)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(id)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(id)
+                lookups.inc(1, self.table, "hit")
+                return entry[1]
+            generation = self.generation
+        lookups.inc(1, self.table, "miss")
+
+        row = db.query(*self.model.__table__.columns).filter(self.model.id == id).first()
+        if row is None:
+            return None
+        value = dict(row._mapping)
+        if self.ttl > 0:
+            with self.lock:
+                if generation == self.generation:
+                    self.entries[id] = (now + self.ttl, value)
+                    self.entries.move_to_end(id)
+                    while len(self.entries) > self.maxEntries:
+                        self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, ids=None):
+        # Evict `ids`, or everything when None
+        with self.lock:
+            self.generation += 1
+            if ids is None:
+                self.entries.clear()
+            else:
+                for id in ids:
+                    self.entries.pop(id, None)
+
+
+ads = RefCache(models.Ad)
+billboards = RefCache(models.Billboard)
+caches = {cache.table: cache for cache in (ads, billboards)}
+cachedModels = tuple(cache.model for cache in caches.values())
+
+# Loop the invalidations are published from, set by start()
+loop = None
+
+
+def start():
+    global loop
+    loop = asyncio.get_running_loop()
+
+
+# -------- Invalidation --------
+def invalidate(table: str, ids: list):
+    # Evict locally right away, then tell the other workers
+    caches[table].invalidate(ids)
+    if loop is not None and not loop.is_closed():
+        # Commits happen in threadpool threads as well as on the loop
+        asyncio.run_coroutine_threadsafe(publishInvalidation(table, ids), loop)
+
+
+async def publishInvalidation(table: str, ids: list):
+    try:
+        await websockets.bus.publish({"kind": "refcache_invalidate", "table": table, "ids": ids})
+    except Exception as e:
+        print(f"Reference cache invalidation not published: {e}")
+
+
+async def onInvalidate(envelope: dict):
+    cache = caches.get(envelope.get("table"))
+    if cache is not None:
+        cache.invalidate(envelope.get("ids"))
+
+
+websockets.envelope_handlers["refcache_invalidate"] = onInvalidate
+
+
+def collectChanges(session, flushContext):
+    # Updates and deletes of cached models, evicted once the commit lands
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, cachedModels) and obj.id is not None:
+            session.info.setdefault("refcacheChanged", set()).add((obj.__tablename__, obj.id))
+
+
+def applyChanges(session):
+    changed = session.info.pop("refcacheChanged", None)
+    if not changed:
+        return
+    byTable = {}
+    for table, id in changed:
+        byTable.setdefault(table, []).append(id)
+    for table, ids in byTable.items():
+        invalidate(table, ids)
+
+
+def discardChanges(session):
+    session.info.pop("refcacheChanged", None)
+
+
+event.listen(database.SessionLocal, "after_flush", collectChanges)
+event.listen(database.SessionLocal, "after_commit", applyChanges)
+event.listen(database.SessionLocal, "after_rollback", discardChanges)
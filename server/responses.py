@@ -0,0 +1,11 @@
+# server/responses.py
+# orjson is optional: use FastAPI's ORJSONResponse when it is installed and
+# fall back to the standard JSONResponse otherwise.
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    orjson = None
+    FastJSONResponse = JSONResponse
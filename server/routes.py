@@ -1,14 +1,15 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Request, status
+from fastapi import APIRouter, Depends, UploadFile, File, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from . import models, schemas, service, database
-
-models.Base.metadata.create_all(bind=database.engine)
+from datetime import datetime
+from .responses import FastJSONResponse
+from . import models, schemas, service, database, playlogs, rollups, sweeper, cachecontrol, exports
 
 router = APIRouter()
 
 # Dependency
 def get_db():
-    db = database.SessionLocal()
+    db = database.getSession()
     try:
         yield db
     finally:
@@ -41,14 +42,69 @@ def uploadAd(uploaded: UploadFile = File(...), db: Session = Depends(get_db)):
 def listAds(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
     return service.getAds(db, skip=skip, limit=limit)
 
+@router.get("/ads/export")
+def exportAds():
+    # NDJSON, one schemas.Ad per line, streamed from a server-side cursor
+    return StreamingResponse(exports.streamAds(), media_type=exports.NDJSON_MEDIA_TYPE)
+
 
 # Schedule
 @router.post("/schedules/", response_model=schemas.Schedule)
 async def createSchedule(schedule: schemas.ScheduleCreate, db: Session = Depends(get_db)):
     return await service.createSchedule(db=db, schedule=schedule)
 
-@router.get("/schedules/", response_model=list[schemas.Schedule])
+@router.get("/schedules/", response_model=list[schemas.Schedule], response_class=FastJSONResponse)
 def listSchedules(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    schedule = service.getSchedules(db, skip=skip, limit=limit)
-    print("Schedules fetched:", schedule)
-    return schedule
+    # Returning the response directly bypasses response_model validation;
+    # getScheduleListing already produces the schemas.Schedule shape
+    return FastJSONResponse(service.getScheduleListing(db, skip=skip, limit=limit))
+
+@router.get("/schedules/export")
+def exportSchedules(billboard_id: int = None):
+    # NDJSON, one schemas.Schedule per line, streamed from a server-side cursor
+    return StreamingResponse(exports.streamSchedules(billboard_id), media_type=exports.NDJSON_MEDIA_TYPE)
+
+@router.get("/schedules/history", response_model=list[schemas.ScheduleHistory])
+def listScheduleHistory(start: datetime = None, end: datetime = None,
+                        ad_id: int = None, billboard_id: int = None,
+                        skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    # Expired schedules archived by the sweeper, filtered on end_time
+    return sweeper.getScheduleHistory(
+        db, start=start, end=end, ad_id=ad_id, billboard_id=billboard_id,
+        skip=skip, limit=limit,
+    )
+
+
+# Remote cache control
+@router.post("/cache-commands/", response_model=schemas.CacheCommandResult)
+async def runCacheCommand(command: schemas.CacheCommandCreate, db: Session = Depends(get_db)):
+    # Answers once every player reached has acknowledged, or on timeout
+    return await cachecontrol.runCommand(db, command)
+
+
+# Proof of play
+@router.post("/play-events/", response_model=schemas.PlayEventAck)
+async def ingestPlayEvents(batch: schemas.PlayEventBatch):
+    try:
+        accepted = await playlogs.ingest(batch.client_id, batch.events)
+    except playlogs.IngestOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retryAfter)},
+        )
+    return {"accepted": accepted}
+
+
+# Reports (served from the play_rollups tables)
+@router.get("/reports/plays", response_model=list[schemas.PlayReportRow])
+def playReport(granularity: str = "hour", start: datetime = None, end: datetime = None,
+               ad_id: int = None, billboard_id: int = None, schedule_id: int = None,
+               skip: int = 0, limit: int = 1000, db: Session = Depends(get_db)):
+    if granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(rollups.GRANULARITIES)}")
+    return rollups.getPlayReport(
+        db, granularity=granularity, start=start, end=end,
+        ad_id=ad_id, billboard_id=billboard_id, schedule_id=schedule_id,
+        skip=skip, limit=limit,
+    )
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Literal, Optional
 
 # -------- Billboard --------
 class BillboardBase(BaseModel):
@@ -20,6 +20,14 @@ class Billboard(BillboardBase):
 class AdBase(BaseModel):
     file_path: str
     file_type: str
+    size_bytes: Optional[int] = None
+    sha256: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration_seconds: Optional[float] = None
+    video_codec: Optional[str] = None
+    bitrate: Optional[int] = None
+    frame_count: Optional[int] = None
 
 class Ad(AdBase):
     id: int
@@ -52,3 +60,85 @@ class Schedule(ScheduleBase):
     id: int
     class Config:
         orm_mode = True
+
+durationAdapter = TypeAdapter(Optional[timedelta])
+
+def encodeDuration(duration: Optional[timedelta]):
+    # Wire format of Schedule.duration (ISO 8601, e.g. "PT12.5S"), for
+    # payloads built without going through the model
+    return durationAdapter.dump_python(duration, mode="json")
+
+class ScheduleHistory(BaseModel):
+    id: int
+    billboard_id: Optional[int] = None
+    ad_id: Optional[int] = None
+    start_time: datetime
+    end_time: datetime
+    duration: Optional[timedelta] = None
+    archived_at: datetime
+    class Config:
+        orm_mode = True
+
+
+# -------- Play events (proof of play) --------
+# play_logs id and duration columns are int4
+INT4_MAX = 2**31 - 1
+
+class PlayEventCreate(BaseModel):
+    event_id: str
+    billboard_id: Optional[int] = Field(None, ge=0, le=INT4_MAX)
+    ad_id: Optional[int] = Field(None, ge=0, le=INT4_MAX)
+    schedule_id: Optional[int] = Field(None, ge=0, le=INT4_MAX)
+    started_at: datetime
+    duration_ms: int = Field(0, ge=0, le=INT4_MAX)
+    error: Optional[str] = None
+
+class PlayEventBatch(BaseModel):
+    client_id: Optional[str] = None
+    events: list[PlayEventCreate]
+
+class PlayEventAck(BaseModel):
+    accepted: list[str]
+
+
+# -------- Reports --------
+class PlayReportRow(BaseModel):
+    bucket_start: datetime
+    ad_id: int
+    billboard_id: int
+    plays: int
+    errors: int
+    total_duration_ms: int
+    class Config:
+        orm_mode = True
+
+
+# -------- Cache commands --------
+class CacheCommandCreate(BaseModel):
+    action: Literal["purge", "invalidate", "prefetch"]
+    # Target billboards by id and/or location
+    billboard_ids: Optional[list[int]] = None
+    location: Optional[str] = None
+    # Media URLs to act on; purge without urls removes everything the
+    # player's playlist doesn't need
+    urls: Optional[list[str]] = None
+    timeout: Optional[float] = None
+
+class CacheCommandAck(BaseModel):
+    client_id: Optional[str] = None
+    billboard_id: Optional[int] = None
+    status: str
+    freed_bytes: int = 0
+    files: int = 0
+    detail: Optional[str] = None
+
+class CacheCommandResult(BaseModel):
+    command_id: str
+    action: str
+    billboard_ids: list[int]
+    dispatched: int
+    acks: list[CacheCommandAck]
+    # Targeted billboards no player acknowledged for
+    missing: list[int]
+    freed_bytes: int
+    timed_out: bool
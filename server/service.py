@@ -1,13 +1,9 @@
+from datetime import timedelta
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
-from . import cloudinaryClient, models, schemas, websockets
-import os 
-from dotenv import load_dotenv
+from . import cloudinaryClient, mediaprobe, models, notifications, refcache, schemas
 from fastapi import HTTPException, status, UploadFile
-from fastapi.encoders import jsonable_encoder
-
-
-
-load_dotenv()
 
 
 # -------- Billboard --------
@@ -26,11 +22,13 @@ def getBillboards(db: Session, skip: int = 0, limit: int = 10, id: int = 0):
 # -------- Ad (upload to Cloudinary) --------
 def createAd(db: Session, uploaded:UploadFile, file_type: str): 
     try:  
-        # Upload file first
+        # Probe locally while the upload is still on disk, then upload
+        metadata = mediaprobe.probeMedia(uploaded.file, file_type)
         file_url = cloudinaryClient.uploadFileToloudinary (uploaded)
         db_ad = models.Ad(
             file_path=file_url,
-            file_type=file_type
+            file_type=file_type,
+            **metadata
             )
         db.add(db_ad)
         db.commit()
@@ -44,27 +42,64 @@ def getAds(db: Session, skip: int = 0, limit: int = 10):
 
 # -------- Schedule --------
 async def createSchedule(db: Session, schedule: schemas.ScheduleCreate):
-    ad = db.query(models.Ad).filter(models.Ad.id == schedule.ad_id).first()
-    billboard = db.query(models.Billboard).filter(models.Billboard.id == schedule.billboard_id).first()
+    # Ad and billboard come from the reference cache, so with both cached the
+    # write is a single INSERT ... RETURNING and the response is built from
+    # the values at hand instead of reloading the row and its relationships
+    ad = refcache.ads.get(db, schedule.ad_id)
+    billboard = refcache.billboards.get(db, schedule.billboard_id)
 
     if not ad or not billboard:
         raise HTTPException(status_code=400, detail="Invalid ad_id or billboard_id")
     
-    db_schedule = models.Schedule(
-        billboard_id=schedule.billboard_id,
-        ad_id=schedule.ad_id,
-        start_time=schedule.start_time,
-        end_time=schedule.end_time,
-        duration=schedule.duration
-    )
-    db.add(db_schedule)
-    db.commit()
-    db.refresh(db_schedule)
+    duration = schedule.duration
+    if duration is None and ad["file_type"].startswith("video") and ad["duration_seconds"]:
+        # Play the whole video unless told otherwise
+        duration = timedelta(seconds=ad["duration_seconds"])
+
+    values = {
+        "billboard_id": schedule.billboard_id,
+        "ad_id": schedule.ad_id,
+        "start_time": schedule.start_time,
+        "end_time": schedule.end_time,
+        "duration": duration,
+    }
+    try:
+        scheduleId = db.execute(
+            insert(models.Schedule).values(**values).returning(models.Schedule.id)
+        ).scalar_one()
+        db.commit()
+    except IntegrityError:
+        # The ad or billboard was deleted while still cached
+        db.rollback()
+        refcache.ads.invalidate([schedule.ad_id])
+        refcache.billboards.invalidate([schedule.billboard_id])
+        raise HTTPException(status_code=400, detail="Invalid ad_id or billboard_id")
+    db_schedule = models.Schedule(id=scheduleId, **values)
+
+    # Bursts of writes reach players as one consolidated notification
+    notifications.scheduleChanged(scheduleMessage(db_schedule))
+    return {
+        **values,
+        "id": scheduleId,
+        "ad": ad,
+        "billboard": billboard,
+    }
 
-    await websockets.broadcast({"type": "new_schedule_created", "schedule": jsonable_encoder(db_schedule)})
-    return db_schedule
+def scheduleMessage(db_schedule: models.Schedule):
+    # JSON-safe dict built straight from the columns, so the notification is
+    # encoded once by the WebSocket layer instead of going through
+    # jsonable_encoder on the ORM object
+    return {
+        "id": db_schedule.id,
+        "billboard_id": db_schedule.billboard_id,
+        "ad_id": db_schedule.ad_id,
+        "start_time": db_schedule.start_time.isoformat(),
+        "end_time": db_schedule.end_time.isoformat(),
+        "duration": schemas.encodeDuration(db_schedule.duration),
+    }
 
 def getSchedules(db: Session, skip: int = 0, limit: int = 10):
+    # ORM path, kept for callers that need model instances
     return (
         db.query(models.Schedule)
         .options(
@@ -76,3 +111,63 @@ def getSchedules(db: Session, skip: int = 0, limit: int = 10):
         .all()
     )
 
+def scheduleListingQuery(db: Session):
+    # Only the columns the response needs, joined in one query. Inner joins:
+    # a schedule without its ad or billboard can't be a schemas.Schedule (the
+    # joinedload path failed response validation on it), so it is left out
+    return (
+        db.query(
+            models.Schedule.id,
+            models.Schedule.billboard_id,
+            models.Schedule.ad_id,
+            models.Schedule.start_time,
+            models.Schedule.end_time,
+            models.Schedule.duration,
+            models.Ad.file_path,
+            models.Ad.file_type,
+            models.Ad.size_bytes,
+            models.Ad.sha256,
+            models.Ad.width,
+            models.Ad.height,
+            models.Ad.duration_seconds,
+            models.Ad.video_codec,
+            models.Ad.bitrate,
+            models.Ad.frame_count,
+            models.Billboard.name,
+            models.Billboard.location,
+        )
+        .join(models.Ad, models.Schedule.ad_id == models.Ad.id)
+        .join(models.Billboard, models.Schedule.billboard_id == models.Billboard.id)
+        .order_by(models.Schedule.id)
+    )
+
+def scheduleListingRow(row):
+    # JSON-safe dict in the schemas.Schedule shape
+    return {
+        "ad": {
+            "file_path": row.file_path,
+            "file_type": row.file_type,
+            "size_bytes": row.size_bytes,
+            "sha256": row.sha256,
+            "width": row.width,
+            "height": row.height,
+            "duration_seconds": row.duration_seconds,
+            "video_codec": row.video_codec,
+            "bitrate": row.bitrate,
+            "frame_count": row.frame_count,
+        },
+        "billboard": {"name": row.name, "location": row.location},
+        "billboard_id": row.billboard_id,
+        "ad_id": row.ad_id,
+        "start_time": row.start_time.isoformat(),
+        "end_time": row.end_time.isoformat(),
+        "duration": schemas.encodeDuration(row.duration),
+        "id": row.id,
+    }
+
+def getScheduleListing(db: Session, skip: int = 0, limit: int = 10):
+    # Read path for GET /schedules/: builds the payload straight from the
+    # selected columns, skipping ORM hydration and pydantic validation.
+    # Output matches schemas.Schedule.
+    rows = scheduleListingQuery(db).offset(skip).limit(limit)
+    return [scheduleListingRow(row) for row in rows]
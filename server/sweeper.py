@@ -0,0 +1,94 @@
+# server/sweeper.py
+# Schedule lifecycle: schedules past their end_time are moved from the hot
+# `schedules` table into `schedules_history`, in small batches that each
+# commit on their own, so listing queries only see current and future rows
+# and the sweep never holds locks for long.
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", 300))
+SWEEP_BATCH_ROWS = int(os.getenv("SWEEP_BATCH_ROWS", 1000))
+# Schedules stay in the hot table this long after they end
+SWEEP_GRACE_SECONDS = float(os.getenv("SWEEP_GRACE_SECONDS", 3600))
+
+# SKIP LOCKED: rows another worker (or a request) is touching are left for
+# the next batch instead of being waited on
+# An id already archived (e.g. a row restored into `schedules` and swept
+# again) is overwritten, the rows just deleted are the latest state
+SWEEP_SQL = text("""
+WITH expired AS (
+    SELECT id FROM schedules
+    WHERE end_time < :cutoff
+    ORDER BY end_time
+    LIMIT :batch
+    FOR UPDATE SKIP LOCKED
+), moved AS (
+    DELETE FROM schedules
+    USING expired
+    WHERE schedules.id = expired.id
+    RETURNING schedules.id, schedules.billboard_id, schedules.ad_id,
+              schedules.start_time, schedules.end_time, schedules.duration
+)
+INSERT INTO schedules_history (id, billboard_id, ad_id, start_time, end_time, duration)
+SELECT id, billboard_id, ad_id, start_time, end_time, duration FROM moved
+ON CONFLICT (id) DO UPDATE SET
+    billboard_id = EXCLUDED.billboard_id,
+    ad_id = EXCLUDED.ad_id,
+    start_time = EXCLUDED.start_time,
+    end_time = EXCLUDED.end_time,
+    duration = EXCLUDED.duration,
+    archived_at = now()
+""")
+
+
+def sweepBatch(db: Session, cutoff: datetime) -> int:
+    # Archive one batch in a single short transaction; returns the rows moved
+    result = db.execute(SWEEP_SQL, {"cutoff": cutoff, "batch": SWEEP_BATCH_ROWS})
+    db.commit()
+    return result.rowcount
+
+
+def runSweep():
+    # Schedule times are stored as naive UTC
+    cutoff = datetime.utcnow() - timedelta(seconds=SWEEP_GRACE_SECONDS)
+    db = database.getSession()
+    try:
+        total = 0
+        while True:
+            moved = sweepBatch(db, cutoff)
+            if not moved:
+                break
+            total += moved
+        if total:
+            print(f"Archived {total} expired schedules")
+    finally:
+        db.close()
+
+
+def getScheduleHistory(db: Session, start: datetime = None, end: datetime = None,
+                       ad_id: int = None, billboard_id: int = None,
+                       skip: int = 0, limit: int = 100):
+    # Archived schedules that ended in [start, end), newest first
+    history = models.ScheduleHistory
+    query = db.query(history)
+
+    if start is not None:
+        query = query.filter(history.end_time >= start)
+    if end is not None:
+        query = query.filter(history.end_time < end)
+    if ad_id is not None:
+        query = query.filter(history.ad_id == ad_id)
+    if billboard_id is not None:
+        query = query.filter(history.billboard_id == billboard_id)
+
+    return (
+        query.order_by(history.end_time.desc(), history.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
@@ -2,55 +2,278 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 
 from typing import List
+import asyncio
+import json
+import time
 import uuid
+from pydantic import ValidationError
+from . import backplane, metrics, playlogs, schemas
+
+# MessagePack is optional, clients fall back to JSON text frames without it
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 router = APIRouter()
 
+SUBPROTOCOL_MSGPACK = "adsync.msgpack"
+
+# Sockets held by this worker only; other workers are reached via the backplane
 active_connections: dict[str, WebSocket] = {}
-async def connect(websocket: WebSocket, socket_id: str):
-    print(f"New WebSocket connection: {socket_id}")
-    await websocket.accept()
+# Wire format negotiated per connection: "json" or "msgpack"
+connection_formats: dict[str, str] = {}
+# Billboard a connection plays for, from ?billboard_id= (absent: all of them)
+connection_billboards: dict[str, int] = {}
+# Schedule ids already hinted on each connection, so a prefetch scan only
+# sends what the player hasn't heard about yet
+prefetch_hinted: dict[str, set] = {}
+bus = backplane.createBackplane()
+# Handlers for backplane envelopes that carry a "kind" instead of a message
+# for sockets, registered by the modules that publish them
+envelope_handlers: dict = {}
+
+backplane_ready = False
+# Reconnect loop started after the LISTEN connection was lost
+backplane_task = None
+
+metrics.registerGauge("ws_connections", "WebSocket connections held by this worker", lambda: len(active_connections))
+
+async def start_backplane(retry_delay: float = 1, max_delay: float = 30):
+    # Keep retrying in the background: a briefly unavailable database must
+    # not stop the worker from booting
+    global backplane_ready
+    delay = retry_delay
+    while True:
+        try:
+            await bus.start(deliver_local, on_backplane_lost)
+            backplane_ready = True
+            return
+        except Exception as e:
+            print(f"Backplane start failed, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+def on_backplane_lost(error: Exception):
+    # The LISTEN connection died: report not ready and reconnect with the
+    # same retry loop as at boot
+    global backplane_ready, backplane_task
+    backplane_ready = False
+    if backplane_task is None or backplane_task.done():
+        backplane_task = asyncio.create_task(start_backplane())
+
+async def stop_backplane():
+    global backplane_ready
+    backplane_ready = False
+    if backplane_task is not None:
+        backplane_task.cancel()
+    await bus.stop()
+
+def negotiate_format(websocket: WebSocket, encoding: str = None):
+    # Clients opt into MessagePack with the "adsync.msgpack" subprotocol or
+    # ?encoding=msgpack. permessage-deflate is negotiated by uvicorn itself
+    # whenever the client offers it in the handshake.
+    offered = websocket.scope.get("subprotocols", [])
+    if msgpack and (encoding == "msgpack" or SUBPROTOCOL_MSGPACK in offered):
+        return "msgpack"
+    return "json"
+
+def encode_message(message: dict, fmt: str):
+    if fmt == "msgpack":
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message, separators=(",", ":"))
+
+async def send_frame(websocket: WebSocket, frame):
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+
+async def receive_message(websocket: WebSocket):
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        if msgpack:
+            return msgpack.unpackb(message["bytes"], raw=False)
+        return json.loads(message["bytes"])
+    return json.loads(message["text"])
+
+async def connect(websocket: WebSocket, socket_id: str, encoding: str = None, billboard_id: int = None):
+    fmt = negotiate_format(websocket, encoding)
+    print(f"New WebSocket connection: {socket_id} ({fmt})")
+    # Only echo the subprotocol back if the client actually offered it
+    subprotocol = None
+    if fmt == "msgpack" and SUBPROTOCOL_MSGPACK in websocket.scope.get("subprotocols", []):
+        subprotocol = SUBPROTOCOL_MSGPACK
+    await websocket.accept(subprotocol=subprotocol)
     active_connections[socket_id]=websocket
+    connection_formats[socket_id] = fmt
+    if billboard_id is not None:
+        connection_billboards[socket_id] = billboard_id
 
 def disconnect(websocket: WebSocket):
     for socket_id, connection in active_connections.items():
         if connection == websocket:
             del active_connections[socket_id]
+            connection_formats.pop(socket_id, None)
+            connection_billboards.pop(socket_id, None)
+            prefetch_hinted.pop(socket_id, None)
             break
 
+async def send_message(client_id: str, message: dict):
+    websocket = active_connections.get(client_id)
+    if websocket:
+        await send_frame(websocket, encode_message(message, connection_formats.get(client_id, "json")))
+
+async def deliver_local(envelope: dict):
+    # Deliver a backplane envelope to the sockets connected to this worker
+    handler = envelope_handlers.get(envelope.get("kind"))
+    if handler is not None:
+        await handler(envelope)
+        return
+
+    message = envelope["message"]
+    client_id = envelope.get("client_id")
+    started_at = time.perf_counter()
+
+    if client_id is not None:
+        await send_message(client_id, message)
+        target = "client"
+        sent = 1 if client_id in active_connections else 0
+    else:
+        print(f"Active connections: {len(active_connections)}")
+        sent = await send_to_sockets(list(active_connections), message)
+        target = "broadcast"
+
+    metrics.wsDeliveryLatency.observe(time.perf_counter() - started_at, target)
+    metrics.wsFramesSent.inc(sent, target)
+
+async def send_to_sockets(socket_ids: list, message: dict) -> int:
+    # Serialize once per wire format and reuse the frame for every socket;
+    # returns the number of sockets reached
+    frames = {}
+    sent = 0
+    for socket_id in socket_ids:
+        connection = active_connections.get(socket_id)
+        if connection is None:
+            continue
+        fmt = connection_formats.get(socket_id, "json")
+        if fmt not in frames:
+            frames[fmt] = encode_message(message, fmt)
+        try:
+            await send_frame(connection, frames[fmt])
+            sent += 1
+        except Exception as e:
+            print(f"Send to {socket_id} failed: {e}")
+    return sent
+
+async def deliver_to_billboards(billboard_ids: list, message: dict) -> int:
+    # Local sockets registered for one of `billboard_ids`
+    targets = set(billboard_ids)
+    socket_ids = [socket_id for socket_id, billboard_id in list(connection_billboards.items()) if billboard_id in targets]
+    return await send_to_sockets(socket_ids, message)
+
 async def broadcast(message: dict):
-    print(f"Active connections: {len(active_connections)}", active_connections)
-    for connection in active_connections.values():
-        print("connection:", connection)
-        await connection.send_json(message)
+    await bus.publish({"client_id": None, "message": message})
+
+async def deliver_grouped(envelope: dict):
+    # One message per billboard for the sockets bound to it, and the combined
+    # "all" message for sockets that play every billboard's schedules
+    started_at = time.perf_counter()
+    sent = 0
+    for billboard_id, message in envelope["by_billboard"].items():
+        sent += await deliver_to_billboards([int(billboard_id)], message)
+    if envelope.get("all") is not None:
+        # Only one envelope of a split burst carries it
+        unbound = [socket_id for socket_id in list(active_connections) if socket_id not in connection_billboards]
+        sent += await send_to_sockets(unbound, envelope["all"])
+    metrics.wsDeliveryLatency.observe(time.perf_counter() - started_at, "grouped")
+    metrics.wsFramesSent.inc(sent, "grouped")
+
+envelope_handlers["grouped"] = deliver_grouped
 
 async def send_to_client(client_id: str, message: dict):
-    websocket = active_connections.get(client_id)
-    print("websocket:", websocket)
-    if websocket:
-        await websocket.send_json(message)
+    if client_id in active_connections:
+        # Connected here, no need to go through the backplane
+        await send_message(client_id, message)
+    else:
+        await bus.publish({"client_id": client_id, "message": message})
+
+async def send_prefetch_hints(assets_by_billboard: dict[int, list]):
+    # Hint upcoming media to the sockets on this worker. Every worker runs the
+    # prefetch scan for its own connections, so hints never cross the
+    # backplane and a reconnecting player is simply hinted again.
+    for socket_id in list(active_connections):
+        billboard_id = connection_billboards.get(socket_id)
+        if billboard_id is None:
+            assets = [asset for group in assets_by_billboard.values() for asset in group]
+        else:
+            assets = assets_by_billboard.get(billboard_id, [])
+
+        upcoming = {asset["schedule_id"] for asset in assets}
+        hinted = prefetch_hinted.setdefault(socket_id, set())
+        hinted &= upcoming  # forget schedules that started or were removed
+        fresh = [asset for asset in assets if asset["schedule_id"] not in hinted]
+        if not fresh:
+            continue
+        try:
+            await send_message(socket_id, {"type": "prefetch", "assets": fresh})
+            hinted.update(asset["schedule_id"] for asset in fresh)
+        except Exception as e:
+            print(f"Prefetch hint to {socket_id} failed: {e}")
+
+async def handle_play_events(client_id: str, payload: dict):
+    try:
+        events = [schemas.PlayEventCreate(**event) for event in payload.get("events", [])]
+    except (TypeError, ValidationError) as e:
+        await send_message(client_id, {"type": "play_events_error", "detail": str(e)})
+        return
+
+    try:
+        accepted = await playlogs.ingest(client_id, events)
+    except playlogs.IngestOverloaded as e:
+        # Client keeps the batch and retries later
+        await send_message(client_id, {"type": "play_events_busy", "retry_after": e.retryAfter})
+        return
+    await send_message(client_id, {"type": "play_events_ack", "accepted": accepted})
 
 @router.websocket("/ws/client")
-async def websocket_endpoint(websocket: WebSocket, client_id: str = Query(default=None)):
+async def websocket_endpoint(websocket: WebSocket, client_id: str = Query(default=None), encoding: str = Query(default=None),
+                             billboard_id: int = Query(default=None)):
     if not client_id:
         client_id = str(uuid.uuid4())
-    await connect(websocket, client_id)
+    await connect(websocket, client_id, encoding, billboard_id)
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await receive_message(websocket)
+            received_at = time.time() * 1000
             event = data.get("event")
             payload = data.get("data")
 
-            if event == "purge":
-                # handle purge action
-                print(f"Purging ad: {payload}")
-                # await broadcast({"type": "purge_ack", "data": payload})
-                await send_to_client(client_id, {"type": "purge_back", "data": payload})
+            # Purges go through POST /api/cache-commands/ (cachecontrol), which
+            # reaches the players of any worker and collects their acks
+            if event == "heartbeat":
+                # Server timestamps (epoch ms) let players estimate their clock
+                # offset and round trip NTP-style; this clock is the timebase
+                # for synchronized playback
+                await send_message(client_id, {
+                    "type": "heartbeat_ack",
+                    "t0": (payload or {}).get("t0"),
+                    "t1": received_at,
+                    "t2": time.time() * 1000,
+                })
+
+            elif event == "cache_ack":
+                # Result of a cache command; routed to the worker that
+                # issued it, which is waiting on the acknowledgements
+                ack = {**(payload or {}), "client_id": client_id, "billboard_id": connection_billboards.get(client_id)}
+                await bus.publish({"kind": "cache_ack", "ack": ack})
 
-            elif event == "heartbeat":
-                print("Got heartbeat")
-                await websocket.send_json({"type": "heartbeat_ack"})
+            elif event == "play_events":
+                # Don't hold up this socket's receive loop while the batch is written
+                asyncio.create_task(handle_play_events(client_id, payload or {}))
             
             # you can add more event handlers here
     except WebSocketDisconnect:
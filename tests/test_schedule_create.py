@@ -0,0 +1,78 @@
+# Schedule writes check the ad and billboard against the reference cache.
+# A row deleted behind the cache's back (another worker, a manual fix) must
+# still get the 400 of the uncached path rather than a 500.
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from server import models, refcache, schemas, service
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def enableForeignKeys(dbapiConnection, record):
+        dbapiConnection.execute("PRAGMA foreign_keys=ON")
+
+    models.Base.metadata.create_all(bind=engine)
+    # Not database.SessionLocal: its commit hooks would evict the cache
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    refcache.ads.invalidate()
+    refcache.billboards.invalidate()
+    monkeypatch.setattr(service.notifications, "scheduleChanged", lambda schedule: None)
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def seed(db):
+    billboard = models.Billboard(name="Main street", location="Zone 1")
+    ad = models.Ad(file_path="https://example.com/ad.mp4", file_type="video/mp4", duration_seconds=12.5)
+    db.add_all([billboard, ad])
+    db.commit()
+    return ad.id, billboard.id
+
+
+def scheduleFor(adId, billboardId):
+    start = datetime(2026, 1, 1)
+    return schemas.ScheduleCreate(ad_id=adId, billboard_id=billboardId,
+                                  start_time=start, end_time=start + timedelta(days=1))
+
+
+def test_create_uses_cached_reference_rows(db):
+    adId, billboardId = seed(db)
+    created = asyncio.run(service.createSchedule(db, scheduleFor(adId, billboardId)))
+    assert created["ad"]["file_path"] == "https://example.com/ad.mp4"
+    assert created["duration"] == timedelta(seconds=12.5)
+    assert adId in refcache.ads.entries and billboardId in refcache.billboards.entries
+
+
+def test_deleted_cached_ad_is_rejected(db):
+    adId, billboardId = seed(db)
+    asyncio.run(service.createSchedule(db, scheduleFor(adId, billboardId)))
+
+    # Delete behind the cache, then schedule the now missing ad
+    db.execute(text("DELETE FROM schedules WHERE ad_id = :id"), {"id": adId})
+    db.execute(text("DELETE FROM ads WHERE id = :id"), {"id": adId})
+    db.commit()
+    assert adId in refcache.ads.entries
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(service.createSchedule(db, scheduleFor(adId, billboardId)))
+    assert error.value.status_code == 400
+    assert adId not in refcache.ads.entries
+
+    # The session is usable again and the uncached path gives the same answer
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(service.createSchedule(db, scheduleFor(adId, billboardId)))
+    assert error.value.status_code == 400
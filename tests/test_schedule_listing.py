@@ -0,0 +1,63 @@
+# The column-projected listing must produce exactly what the response_model
+# path (ORM objects validated into schemas.Schedule, then jsonable_encoder)
+# does, since clients can't tell which one served them.
+import os
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from server import models, schemas, service
+
+scheduleList = TypeAdapter(list[schemas.Schedule])
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def seed(db):
+    billboard = models.Billboard(name="Main street", location="Zone 1")
+    video = models.Ad(file_path="https://example.com/ad.mp4", file_type="video/mp4",
+                      size_bytes=1024, sha256="ab" * 32, width=1920, height=1080,
+                      duration_seconds=12.5, video_codec="h264", bitrate=800000, frame_count=300)
+    image = models.Ad(file_path="https://example.com/ad.png", file_type="image/png")
+    db.add_all([billboard, video, image])
+    db.flush()
+
+    start = datetime(2026, 1, 1, 8, 30, 15, 250000)
+    durations = [timedelta(seconds=12.5), None, timedelta(minutes=1, seconds=30), timedelta(days=1, hours=2)]
+    for i, duration in enumerate(durations):
+        db.add(models.Schedule(
+            billboard_id=billboard.id,
+            ad_id=(video if i % 2 else image).id,
+            start_time=start + timedelta(hours=i),
+            end_time=start + timedelta(days=30),
+            duration=duration,
+        ))
+    db.commit()
+
+
+def test_listing_matches_response_model(db):
+    seed(db)
+    expected = jsonable_encoder(scheduleList.validate_python(service.getSchedules(db, limit=100), from_attributes=True))
+    assert service.getScheduleListing(db, limit=100) == expected
+
+
+def test_duration_uses_schema_wire_format(db):
+    seed(db)
+    durations = [row["duration"] for row in service.getScheduleListing(db, limit=100)]
+    assert durations[0] == "PT12.5S"
+    assert durations[1] is None